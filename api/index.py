@@ -1,6 +1,19 @@
+from contextlib import asynccontextmanager
+from anyio import to_thread
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse
 from .routers import etf_router
+from .utils.config import THREADPOOL_TOKENS
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Raise the worker threadpool size used by run_in_threadpool on startup."""
+    to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_TOKENS
+    yield
+
 
 ### Create FastAPI instance with custom docs and openapi url
 # API versioning included in router prefixes
@@ -9,7 +22,9 @@ app = FastAPI(
     description="API for analyzing ETF constituents and calculating historical prices",
     version="1.0.0",
     docs_url="/api/py/docs",
-    openapi_url="/api/py/openapi.json"
+    openapi_url="/api/py/openapi.json",
+    default_response_class=ORJSONResponse,  # Serialize responses in C via orjson
+    lifespan=lifespan
 )
 
 # Configure CORS to allow frontend to communicate with backend
@@ -21,6 +36,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress large responses (the time_series JSON is highly repetitive)
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=5)
+
 # Include routers
 app.include_router(etf_router.router)
 
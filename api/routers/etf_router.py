@@ -3,10 +3,20 @@ ETF router handling all ETF-related endpoints.
 This module contains endpoints for uploading ETF files and retrieving ETF data.
 """
 
-from fastapi import APIRouter, File, UploadFile, HTTPException
-from typing import Dict, Any
-from api.services import DataLoader, ETFCalculator, ETFValidator, ETFDataParser
-from api.utils.config import ETF_WEIGHT_TOLERANCE
+import hashlib
+from cachetools import TTLCache
+from fastapi import APIRouter, File, UploadFile, HTTPException, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import ORJSONResponse
+from typing import Dict, Any, Optional
+from api.services import Constituents, DataLoader, ETFCalculator, ETFValidator, ETFRequestCtx, get_parser
+from api.utils.config import (
+    ETF_WEIGHT_TOLERANCE,
+    MAX_UPLOAD_BYTES,
+    PARSE_CACHE_BYTES,
+    RESPONSE_CACHE_SIZE,
+    RESPONSE_CACHE_TTL,
+)
 from api.utils.logger import setup_logger
 
 logger = setup_logger(__name__)
@@ -19,11 +29,54 @@ router = APIRouter(prefix="/api/py/v1", tags=["ETF"])
 data_loader = DataLoader()
 calculator = ETFCalculator()
 validator = ETFValidator(tolerance=ETF_WEIGHT_TOLERANCE)
-parser = ETFDataParser()
+parser = get_parser(MAX_UPLOAD_BYTES, PARSE_CACHE_BYTES)
+
+# Serialized analysis responses keyed by (upload SHA-256, price data version).
+# Only touched from the event loop, so no locking is needed.
+_response_cache: TTLCache = TTLCache(maxsize=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL)
+
+
+def _too_large_detail(size: Optional[int] = None) -> str:
+    """Build the error detail for an upload over MAX_UPLOAD_BYTES."""
+    size_text = f"{size} bytes" if size is not None else f"over {MAX_UPLOAD_BYTES} bytes"
+    return f"File too large: {size_text} (maximum {MAX_UPLOAD_BYTES} bytes)"
+
+
+def _compute_analysis(constituents: Constituents) -> Dict[str, Any]:
+    """
+    Run the CPU-bound ETF calculations for validated constituents.
+    
+    Called through run_in_threadpool so the event loop keeps serving
+    other requests while pandas/NumPy do the work.
+    
+    Args:
+        constituents: Parsed constituents (names and weight array)
+    
+    Returns:
+        Dict containing status, table_data, time_series, and top_holdings
+    """
+    # Derive symbols, weights and matrix columns once for all calculations
+    ctx = ETFRequestCtx.from_constituents(constituents, data_loader)
+    
+    # Get table data (constituents with latest prices) and top 5 holdings in one pass
+    table_data, top_holdings = calculator.compute_holdings(ctx, top_n=5)
+    
+    # Calculate time series (historical ETF prices)
+    _, etf_prices = calculator.calculate_etf_series(ctx)
+    dates = data_loader.get_date_strings()
+    prices = etf_prices.tolist()
+    time_series = [{'date': d, 'price': p} for d, p in zip(dates, prices)]
+    
+    return {
+        'status': 'success',
+        'table_data': table_data,
+        'time_series': time_series,
+        'top_holdings': top_holdings
+    }
 
 
 @router.post("/etfs")
-async def create_etf_analysis(file: UploadFile = File(...)) -> Dict[str, Any]:
+async def create_etf_analysis(file: UploadFile = File(...)) -> Response:
     """
     Create ETF analysis from uploaded CSV file.
     
@@ -33,51 +86,56 @@ async def create_etf_analysis(file: UploadFile = File(...)) -> Dict[str, Any]:
     B,0.15
     ...
     
+    Identical uploads are answered from a cache of serialized responses
+    until the TTL expires or the price data is reloaded.
+    
     Returns:
-        Dict containing table_data, time_series, and top_holdings
+        JSON response containing table_data, time_series, and top_holdings
+        (returned directly so FastAPI skips re-encoding the payload)
     """
     try:
-        # Step 1: Parse and validate file format
-        content = await file.read()
+        # Reject oversized uploads before buffering, hashing or parsing them:
+        # check the declared size, then read at most one byte past the limit
+        if file.size is not None and file.size > MAX_UPLOAD_BYTES:
+            raise HTTPException(status_code=413, detail=_too_large_detail(file.size))
+        content = await file.read(MAX_UPLOAD_BYTES + 1)
+        if len(content) > MAX_UPLOAD_BYTES:
+            raise HTTPException(status_code=413, detail=_too_large_detail())
+        
+        # Serve repeated uploads straight from the response cache
+        # (the digest is computed once and reused as the parse cache key)
+        digest = hashlib.sha256(content, usedforsecurity=False).digest()
+        cache_key = (digest, data_loader.get_data_version())
+        cached = _response_cache.get(cache_key)
+        if cached is not None:
+            logger.info(f"ETF analysis served from cache: {file.filename}")
+            return Response(content=cached, media_type="application/json")
+        
+        # Step 1: Parse and validate file format (in a worker thread)
         try:
-            constituents = parser.parse_csv_file(content, file.filename)
+            constituents = await run_in_threadpool(parser.parse_csv_file, content, file.filename, digest)
         except ValueError as e:
             raise HTTPException(status_code=400, detail=str(e))
         
-        # Step 2: Validate business rules
-        available_symbols = data_loader.get_available_symbols()
-        is_valid, errors = validator.validate_all(constituents, available_symbols)
+        # Step 2: Validate business rules (in a worker thread, off the event loop)
+        available_symbols = data_loader.get_symbol_set()
+        is_valid, errors = await run_in_threadpool(
+            validator.validate_all, constituents, available_symbols, cache_key=cache_key
+        )
         
         if not is_valid:
             logger.warning(f"ETF validation failed with {len(errors)} error(s): {errors}")
             error_detail = "ETF data validation failed:\n" + "\n".join(f"- {err}" for err in errors)
             raise HTTPException(status_code=400, detail=error_detail)
         
-        # Step 3: Calculate ETF data
-        # Get table data (constituents with latest prices)
-        table_data = calculator.get_latest_prices(constituents)
-        
-        # Calculate time series (historical ETF prices)
-        etf_prices_df = calculator.calculate_etf_prices(constituents)
-        time_series = [
-            {
-                'date': row['DATE'].strftime('%Y-%m-%d'),
-                'price': float(row['etf_price'])
-            }
-            for _, row in etf_prices_df.iterrows()
-        ]
-        
-        # Calculate top 5 holdings
-        top_holdings = calculator.get_top_holdings(constituents, top_n=5)
+        # Step 3: Calculate ETF data in a worker thread (NumPy releases the GIL)
+        result = await run_in_threadpool(_compute_analysis, constituents)
         
-        logger.info(f"ETF analysis completed: {len(constituents)} constituents, {len(time_series)} data points")
+        logger.info(f"ETF analysis completed: {len(constituents)} constituents, {len(result['time_series'])} data points")
         
-        return {
-            'status': 'success',
-            'table_data': table_data,
-            'time_series': time_series,
-            'top_holdings': top_holdings
-        }
+        response = ORJSONResponse(content=result)
+        _response_cache[cache_key] = response.body
+        return response
         
     except HTTPException:
         raise
@@ -5,16 +5,19 @@ This package contains business logic services for ETF calculations and data load
 
 Available services:
 - ETFCalculator: Handles ETF price calculations and analytics
+- ETFRequestCtx: Per-request constituent arrays shared by calculator methods
 - DataLoader: Manages historical price data loading and caching
 - ETFValidator: Validates ETF data quality and constraints
+- ETFDataParser / get_parser: Parses uploaded ETF CSV files (get_parser returns a shared instance)
+- Constituents: Parsed constituents as a names tuple and a weights array
 """
 
 # Import services for easier access
-from .calculator import ETFCalculator
+from .calculator import ETFCalculator, ETFRequestCtx
 from .data_loader import DataLoader
 from .validator import ETFValidator
-from .etf_parser import ETFDataParser
+from .etf_parser import Constituents, ETFDataParser, get_parser
 
 # Define what gets imported with "from api.services import *"
-__all__ = ['ETFCalculator', 'DataLoader', 'ETFValidator', 'ETFDataParser']
+__all__ = ['ETFCalculator', 'ETFRequestCtx', 'DataLoader', 'ETFValidator', 'ETFDataParser', 'Constituents', 'get_parser']
 
@@ -0,0 +1,95 @@
+"""
+Compiled numeric kernels for the ETF calculations and validation.
+Uses numba (a requirement of the API) and falls back to NumPy if the
+import fails, e.g. on a platform without numba wheels.
+"""
+
+import numpy as np
+
+try:
+    import numba
+except ImportError:  # pragma: no cover - NumPy is used as a fallback
+    numba = None
+
+HAS_NUMBA = numba is not None
+
+# Below this many matrix elements NumPy's matmul is faster than spinning up
+# the parallel kernel
+PARALLEL_MIN_ELEMENTS = 1 << 16
+
+# The NumPy path upcasts the matrix to float64 in row blocks of about this
+# many elements, so it never copies the whole matrix
+FALLBACK_BLOCK_ELEMENTS = 1 << 16
+
+
+if HAS_NUMBA:
+    # Only reassociation and FMA contraction are allowed, so the row sums can
+    # be vectorized; full fastmath would let LLVM assume there are no NaNs,
+    # but missing prices are NaN in the matrix
+    @numba.njit(parallel=True, fastmath={'reassoc', 'contract'}, cache=True)
+    def _weighted_sum_kernel(matrix, weights, out):
+        """Row-parallel matrix-vector product computed in float64."""
+        T, N = matrix.shape
+        for t in numba.prange(T):
+            s = 0.0
+            for j in range(N):
+                s += np.float64(matrix[t, j]) * np.float64(weights[j])
+            out[t] = s
+
+    # No fastmath here: it would let LLVM assume NaNs never occur
+    @numba.njit(cache=True)
+    def _check_ranges_kernel(weights):
+        """Index of the first weight that is NaN or outside [0, 1], or -1."""
+        for i in range(weights.shape[0]):
+            w = weights[i]
+            # Written so that NaN (all comparisons false) fails the check
+            if not (w >= 0.0 and w <= 1.0):
+                return i
+        return -1
+
+
+def weighted_sum(matrix: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    """
+    Compute the weighted sum of every matrix row (matrix @ weights).
+
+    Args:
+        matrix: C-contiguous float32 array of shape (T, N)
+        weights: float32 array of length N
+
+    Returns:
+        np.ndarray: float64 array of length T, computed in float64 on both
+        paths so results do not change at PARALLEL_MIN_ELEMENTS
+    """
+    if HAS_NUMBA and matrix.size >= PARALLEL_MIN_ELEMENTS:
+        out = np.empty(matrix.shape[0], dtype=np.float64)
+        _weighted_sum_kernel(matrix, weights, out)
+        return out
+    # NumPy path (small matrices, or no numba): float64 matmul one row block
+    # at a time, so the temporary copy stays small whatever the matrix size
+    T, N = matrix.shape
+    out = np.empty(T, dtype=np.float64)
+    weights64 = weights.astype(np.float64)
+    rows = max(1, FALLBACK_BLOCK_ELEMENTS // max(N, 1))
+    for start in range(0, T, rows):
+        stop = start + rows
+        np.matmul(matrix[start:stop].astype(np.float64), weights64, out=out[start:stop])
+    return out
+
+
+def check_ranges(weights: np.ndarray) -> int:
+    """
+    Find the first weight that is NaN or outside [0, 1].
+
+    The compiled kernel stops at the first invalid weight, so a valid
+    list costs one pass and no temporary arrays.
+
+    Args:
+        weights: float64 array of constituent weights
+
+    Returns:
+        int: Index of the first invalid weight, or -1 if all are valid
+    """
+    if HAS_NUMBA:
+        return int(_check_ranges_kernel(weights))
+    bad = ~((weights >= 0.0) & (weights <= 1.0))
+    return int(bad.argmax()) if bad.any() else -1
@@ -3,123 +3,240 @@ Calculator service for ETF price computations.
 Handles weighted sum calculations and top holdings analysis.
 """
 
+import numpy as np
 import pandas as pd
-from typing import List, Dict, Any
+from dataclasses import dataclass
+from heapq import nlargest
+from typing import List, Dict, Any, Sequence, Tuple, Union
 from .data_loader import DataLoader
+from .etf_parser import Constituents
+from ._kernels import weighted_sum
 from api.utils.logger import setup_logger
 
 logger = setup_logger(__name__)
 
 
+# eq=False: generated __eq__/__hash__ would compare the ndarray fields,
+# which raises, so contexts compare by identity
+@dataclass(frozen=True, eq=False)
+class ETFRequestCtx:
+    """
+    Per-request view of the constituents, built once and shared by all
+    ETFCalculator methods so symbols, weights and price-matrix columns
+    are not re-derived for every calculation.
+
+    Attributes:
+        symbols: Constituent symbols in input order
+        weights: Constituent weights as a float64 array
+        col_indices: Price matrix column of each symbol (-1 if unknown)
+    """
+    symbols: List[str]
+    weights: np.ndarray
+    col_indices: np.ndarray
+
+    @classmethod
+    def from_constituents(
+        cls,
+        constituents: Sequence[Dict[str, Any]],
+        data_loader: DataLoader
+    ) -> 'ETFRequestCtx':
+        """
+        Build the context for a list of constituents.
+
+        Args:
+            constituents: List of dicts with 'name' and 'weight' keys, or parsed
+                          Constituents whose arrays are used as they are
+            data_loader: DataLoader providing the symbol → column index map
+
+        Returns:
+            ETFRequestCtx for the given constituents
+        """
+        symbol_idx = data_loader.get_symbol_index()
+        if isinstance(constituents, Constituents):
+            symbols = list(constituents.names)
+            weights = constituents.weights
+        else:
+            symbols = [c['name'] for c in constituents]
+            weights = np.fromiter(
+                (c['weight'] for c in constituents), dtype=np.float64, count=len(symbols)
+            )
+        count = len(symbols)
+        col_indices = np.fromiter(
+            (symbol_idx.get(s, -1) for s in symbols), dtype=np.intp, count=count
+        )
+        return cls(symbols=symbols, weights=weights, col_indices=col_indices)
+
+
+# Calculator methods accept raw or parsed constituents, or a prebuilt context
+ConstituentsArg = Union[List[Dict[str, Any]], Constituents, ETFRequestCtx]
+
+
 class ETFCalculator:
     """
     Service class for calculating ETF prices and analytics.
     """
-    
+
     def __init__(self):
         """Initialize calculator with data loader."""
         self.data_loader = DataLoader()
-    
-    def calculate_etf_prices(self, constituents: List[Dict[str, Any]]) -> pd.DataFrame:
+
+    def _context(self, constituents: ConstituentsArg) -> ETFRequestCtx:
+        """Return the request context, building it if raw constituents were given."""
+        if isinstance(constituents, ETFRequestCtx):
+            return constituents
+        return ETFRequestCtx.from_constituents(constituents, self.data_loader)
+
+    def calculate_etf_series(self, constituents: ConstituentsArg) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Calculate historical ETF prices as plain arrays.
+        ETF Price = Σ(weight × constituent_price) for each date
+
+        Args:
+            constituents: List of dicts with 'name' and 'weight' keys, parsed
+                          Constituents, or an ETFRequestCtx built from them
+
+        Returns:
+            Tuple of (dates, etf_prices)
+            - dates: Shared read-only datetime64 array (must not be modified)
+            - etf_prices: float64 array aligned with dates
+        """
+        ctx = self._context(constituents)
+        price_matrix = self.data_loader.get_matrix()
+
+        known = ctx.col_indices >= 0
+        if not known.all():
+            for symbol, is_known in zip(ctx.symbols, known.tolist()):
+                if not is_known:
+                    logger.warning(f"Symbol '{symbol}' not found in price data, skipping")
+
+        # Scatter weights into a dense vector aligned with the matrix columns
+        weights = np.zeros(price_matrix.shape[1], dtype=np.float64)
+        np.add.at(weights, ctx.col_indices[known], ctx.weights[known])
+
+        # Weighted sum for every date as a single float32 matrix-vector product
+        # (T×N · N), returned as float64
+        etf_price = weighted_sum(price_matrix, weights.astype(np.float32))
+
+        return self.data_loader.get_dates(), etf_price
+
+    def calculate_etf_prices(self, constituents: ConstituentsArg) -> pd.DataFrame:
         """
         Calculate historical ETF prices based on constituent weights.
         ETF Price = Σ(weight × constituent_price) for each date
-        
+
         Args:
-            constituents: List of dicts with 'name' and 'weight' keys
-            
+            constituents: List of dicts with 'name' and 'weight' keys, parsed
+                          Constituents, or an ETFRequestCtx built from them
+
         Returns:
             pd.DataFrame: DataFrame with 'DATE' and 'etf_price' columns
         """
-        prices_df = self.data_loader.get_prices()
-        
-        # Create a copy with just the DATE column
-        etf_prices = prices_df[['DATE']].copy()
-        
-        # Calculate weighted sum for each constituent
-        etf_prices['etf_price'] = 0.0
-        
-        for constituent in constituents:
-            symbol = constituent['name']
-            weight = constituent['weight']
-            
-            # Check if symbol exists in price data
-            if symbol in prices_df.columns:
-                # Add weighted price to ETF price
-                etf_prices['etf_price'] += prices_df[symbol] * weight
-            else:
-                logger.warning(f"Symbol '{symbol}' not found in price data, skipping")
-        
-        return etf_prices
-    
-    def get_latest_prices(self, constituents: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        dates, etf_price = self.calculate_etf_series(constituents)
+        return pd.DataFrame({
+            'DATE': dates,
+            'etf_price': etf_price
+        })
+
+    def _build_holdings_with_values(
+        self,
+        ctx: ETFRequestCtx
+    ) -> Tuple[List[Dict[str, Any]], np.ndarray]:
         """
-        Get the latest price for each constituent.
-        
+        Look up latest prices and holding values for all constituents at once.
+
         Args:
-            constituents: List of dicts with 'name' and 'weight' keys
-            
+            ctx: Request context built from the constituents
+
         Returns:
-            List of dicts with 'symbol', 'weight', and 'latest_price' keys
+            Tuple of (table_data, holding_values)
+            - table_data: List of dicts with 'symbol', 'weight', and 'latest_price' keys,
+              in constituent order (unknown symbols get a price of 0.0)
+            - holding_values: float64 array of weight × latest_price, aligned with table_data
         """
-        prices_df = self.data_loader.get_prices()
-        
         # Get the last row (most recent date)
-        latest_prices_row = prices_df.iloc[-1]
-        
-        result = []
-        for constituent in constituents:
-            symbol = constituent['name']
-            weight = constituent['weight']
-            
-            # Get latest price for this symbol
-            latest_price = latest_prices_row.get(symbol, 0.0) if symbol in prices_df.columns else 0.0
-            
-            result.append({
+        latest_prices_row = self.data_loader.get_latest_row()
+
+        # Gather latest prices for all constituents at once (-1 marks unknown symbols)
+        idxs = ctx.col_indices
+        known = idxs >= 0
+        prices = np.zeros(len(idxs), dtype=np.float64)
+        prices[known] = latest_prices_row[idxs[known]]
+        values = ctx.weights * prices
+
+        table_data = [
+            {
                 'symbol': symbol,
                 'weight': weight,
-                'latest_price': float(latest_price)
-            })
-        
-        return result
-    
-    def get_top_holdings(self, constituents: List[Dict[str, Any]], top_n: int = 5) -> List[Dict[str, Any]]:
+                'latest_price': price
+            }
+            for symbol, weight, price in zip(ctx.symbols, ctx.weights.tolist(), prices.tolist())
+        ]
+        return table_data, values
+
+    def compute_holdings(
+        self,
+        constituents: ConstituentsArg,
+        top_n: int = 5
+    ) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """
+        Compute table data and top N holdings in a single pass over the latest prices.
+        Holding value = weight × latest_price
+
+        Args:
+            constituents: List of dicts with 'name' and 'weight' keys, parsed
+                          Constituents, or an ETFRequestCtx built from them
+            top_n: Number of top holdings to return (default: 5)
+
+        Returns:
+            Tuple of (table_data, top_holdings)
+            - table_data: List of dicts with 'symbol', 'weight', and 'latest_price' keys,
+              in constituent order (unknown symbols get a price of 0.0)
+            - top_holdings: List of dicts with 'symbol', 'weight', 'latest_price', and
+              'holding_value' keys, sorted by holding_value in descending order
+        """
+        table_data, values = self._build_holdings_with_values(self._context(constituents))
+
+        # Select the top N with a bounded heap, O(N log top_n); nlargest is
+        # stable, so ties keep input order
+        if top_n <= 0:
+            return table_data, []
+        holding_values = values.tolist()
+        top_idx = nlargest(top_n, range(len(holding_values)), key=holding_values.__getitem__)
+
+        top_holdings = [
+            {**table_data[i], 'holding_value': holding_values[i]}
+            for i in top_idx
+        ]
+
+        return table_data, top_holdings
+
+    def get_latest_prices(self, constituents: ConstituentsArg) -> List[Dict[str, Any]]:
+        """
+        Get the latest price for each constituent.
+
+        Args:
+            constituents: List of dicts with 'name' and 'weight' keys, parsed
+                          Constituents, or an ETFRequestCtx built from them
+
+        Returns:
+            List of dicts with 'symbol', 'weight', and 'latest_price' keys
+        """
+        table_data, _ = self._build_holdings_with_values(self._context(constituents))
+        return table_data
+
+    def get_top_holdings(self, constituents: ConstituentsArg, top_n: int = 5) -> List[Dict[str, Any]]:
         """
         Calculate and return the top N holdings by market value.
         Holding value = weight × latest_price
-        
+
         Args:
-            constituents: List of dicts with 'name' and 'weight' keys
+            constituents: List of dicts with 'name' and 'weight' keys, parsed
+                          Constituents, or an ETFRequestCtx built from them
             top_n: Number of top holdings to return (default: 5)
-            
+
         Returns:
             List of dicts with 'symbol', 'weight', 'latest_price', and 'holding_value' keys,
             sorted by holding_value in descending order
         """
-        prices_df = self.data_loader.get_prices()
-        
-        # Get the last row (most recent date)
-        latest_prices_row = prices_df.iloc[-1]
-        
-        holdings = []
-        for constituent in constituents:
-            symbol = constituent['name']
-            weight = constituent['weight']
-            
-            # Get latest price for this symbol
-            latest_price = latest_prices_row.get(symbol, 0.0) if symbol in prices_df.columns else 0.0
-            
-            # Calculate holding value (weight × price)
-            holding_value = weight * float(latest_price)
-            
-            holdings.append({
-                'symbol': symbol,
-                'weight': weight,
-                'latest_price': float(latest_price),
-                'holding_value': holding_value
-            })
-        
-        # Sort by holding_value in descending order and return top N
-        holdings.sort(key=lambda x: x['holding_value'], reverse=True)
-        return holdings[:top_n]
-
+        _, top_holdings = self.compute_holdings(constituents, top_n=top_n)
+        return top_holdings
@@ -3,22 +3,49 @@ Data loader service for loading and caching price data.
 This service loads the historical prices CSV file at startup and keeps it in memory.
 """
 
+import itertools
+import os
+import tempfile
+import numpy as np
 import pandas as pd
 from pathlib import Path
-from typing import Optional
+from typing import Dict, FrozenSet, List, Optional
 from api.utils.logger import setup_logger
 
+try:
+    import pyarrow as pa
+except ImportError:  # pragma: no cover - NumPy-backed columns are used instead
+    pa = None
+
 logger = setup_logger(__name__)
 
+# Data directory at the project root (parent of api/)
+DATA_DIR = Path(__file__).parent.parent.parent / "data"
+
+# Process-wide counter so every (re)load gets a distinct data version
+_DATA_VERSIONS = itertools.count(1)
+
 
 class DataLoader:
     """
     Singleton class to load and cache historical price data.
     The prices.csv file is loaded once at initialization and kept in memory.
+    
+    Alongside the DataFrame, a read-only NumPy price matrix (dates × symbols),
+    the date array and a symbol → column index map are cached so that
+    calculations can index shared arrays instead of copying the DataFrame.
     """
     
     _instance: Optional['DataLoader'] = None
     _prices_df: Optional[pd.DataFrame] = None
+    _dates: Optional[np.ndarray] = None
+    _date_strings: Optional[List[str]] = None
+    _symbols: Optional[List[str]] = None
+    _matrix: Optional[np.ndarray] = None
+    _latest_row: Optional[np.ndarray] = None
+    _symbol_idx: Optional[Dict[str, int]] = None
+    _symbol_set: Optional[FrozenSet[str]] = None
+    _data_version: int = 0
     
     def __new__(cls):
         """Implement singleton pattern to ensure only one instance exists."""
@@ -33,23 +60,147 @@ class DataLoader:
     
     def load_prices(self) -> None:
         """
-        Load the historical prices CSV file into memory.
-        The file is expected to be in the data/ directory.
+        Load the historical prices into memory.
+        The prices.csv file is expected to be in the data/ directory.
+        
+        The parsed and sorted prices are cached next to it as prices.parquet,
+        which is read instead of the CSV on later startups as long as it is
+        not older than prices.csv.
         """
-        # Get the project root directory (parent of api/)
-        project_root = Path(__file__).parent.parent.parent
-        prices_path = project_root / "data" / "prices.csv"
+        prices_path = DATA_DIR / "prices.csv"
+        parquet_path = DATA_DIR / "prices.parquet"
         
-        # Load prices and convert DATE column to datetime
-        self._prices_df = pd.read_csv(prices_path)
-        self._prices_df['DATE'] = pd.to_datetime(self._prices_df['DATE'])
+        prices_df = None
+        if self._is_parquet_fresh(parquet_path, prices_path):
+            prices_df = self._read_parquet(parquet_path)
         
-        # Sort by date to ensure chronological order
-        self._prices_df = self._prices_df.sort_values('DATE').reset_index(drop=True)
+        if prices_df is not None:
+            self._prices_df = prices_df
+        else:
+            self._prices_df = self._read_prices_csv(prices_path)
+            
+            # Sort by date to ensure chronological order
+            self._prices_df = self._prices_df.sort_values('DATE').reset_index(drop=True)
+            self._write_parquet(parquet_path)
+        
+        self._build_price_index()
         
         logger.info(f"Loaded {len(self._prices_df)} rows of price data")
         logger.info(f"Date range: {self._prices_df['DATE'].min()} to {self._prices_df['DATE'].max()}")
     
+    @staticmethod
+    def _read_prices_csv(prices_path: Path) -> pd.DataFrame:
+        """
+        Parse prices.csv into a DataFrame with a datetime DATE column.
+        
+        With pyarrow installed the columns are Arrow-backed (pd.ArrowDtype):
+        DATE as timestamp[ns] and every price as float64, so integer-looking
+        columns do not get a different dtype.
+        
+        Args:
+            prices_path: Path to prices.csv
+            
+        Returns:
+            pd.DataFrame: Unsorted prices
+        """
+        if pa is None:
+            df = pd.read_csv(prices_path)
+            df['DATE'] = pd.to_datetime(df['DATE'])
+            return df
+        
+        df = pd.read_csv(prices_path, engine='pyarrow', dtype_backend='pyarrow')
+        price_dtype = pd.ArrowDtype(pa.float64())
+        return df.astype({
+            col: pd.ArrowDtype(pa.timestamp('ns')) if col == 'DATE' else price_dtype
+            for col in df.columns
+        })
+    
+    @staticmethod
+    def _is_parquet_fresh(parquet_path: Path, prices_path: Path) -> bool:
+        """Check whether the Parquet cache exists and is not older than the CSV."""
+        try:
+            return parquet_path.stat().st_mtime >= prices_path.stat().st_mtime
+        except FileNotFoundError:
+            return False
+    
+    @staticmethod
+    def _read_parquet(parquet_path: Path) -> Optional[pd.DataFrame]:
+        """
+        Read the Parquet cache of the prices.
+        
+        Args:
+            parquet_path: Path to prices.parquet
+            
+        Returns:
+            pd.DataFrame: Cached prices, or None if the cache cannot be read
+            (e.g. a corrupt file), in which case prices.csv is parsed instead
+        """
+        # Arrow-backed columns, as _read_prices_csv produces
+        backend = {'dtype_backend': 'pyarrow'} if pa is not None else {}
+        try:
+            df = pd.read_parquet(parquet_path, **backend)
+        except Exception as e:
+            logger.warning(f"Could not read Parquet cache, parsing prices.csv instead: {str(e)}")
+            return None
+        logger.info(f"Loaded prices from cache: {parquet_path.name}")
+        return df
+    
+    def _write_parquet(self, parquet_path: Path) -> None:
+        """
+        Cache the parsed prices as Parquet for faster startups.
+        
+        The file is written under a temporary name in the same directory and
+        then renamed into place, so an interrupted write or a concurrent
+        worker never leaves a truncated cache behind.
+        Failures are logged and ignored (e.g. read-only data directory).
+        """
+        tmp_path = None
+        try:
+            with tempfile.NamedTemporaryFile(
+                dir=parquet_path.parent, prefix=f".{parquet_path.name}.", suffix=".tmp", delete=False
+            ) as tmp:
+                tmp_path = Path(tmp.name)
+                self._prices_df.to_parquet(tmp, compression='snappy')
+            os.replace(tmp_path, parquet_path)
+            tmp_path = None
+            logger.info(f"Cached prices to: {parquet_path.name}")
+        except (ImportError, OSError) as e:
+            logger.warning(f"Could not cache prices as Parquet: {str(e)}")
+        finally:
+            # Remove the partial file if the write or rename did not complete
+            if tmp_path is not None:
+                tmp_path.unlink(missing_ok=True)
+    
+    def _build_price_index(self) -> None:
+        """
+        Build the read-only NumPy views of the loaded prices.
+        Must be called whenever _prices_df is (re)assigned.
+        """
+        self._dates = self._prices_df['DATE'].to_numpy(dtype='datetime64[ns]', copy=True)
+        self._dates.flags.writeable = False
+        # ISO date strings for responses, formatted once in C per load
+        self._date_strings = np.datetime_as_string(self._dates, unit='D').tolist()
+        self._symbols = [col for col in self._prices_df.columns if col != 'DATE']
+        # Arrow-backed columns hold missing prices as nulls; map them to NaN
+        prices = self._prices_df[self._symbols].to_numpy(dtype=np.float64, na_value=np.nan)
+        # float32 halves the bytes streamed by the memory-bound P @ w product;
+        # ~7 significant digits is ample for prices shown to a few decimals
+        self._matrix = np.ascontiguousarray(prices, dtype=np.float32)
+        self._matrix.flags.writeable = False
+        # Latest prices are shown as-is, so keep them at full precision
+        self._latest_row = prices[-1].copy() if len(prices) else np.zeros(len(self._symbols))
+        self._latest_row.flags.writeable = False
+        self._symbol_idx = {symbol: i for i, symbol in enumerate(self._symbols)}
+        self._symbol_set = frozenset(self._symbols)
+        self._data_version = next(_DATA_VERSIONS)
+    
+    def _ensure_price_index(self) -> None:
+        """Load prices and build the NumPy views if not done yet."""
+        if self._prices_df is None:
+            self.load_prices()
+        if self._matrix is None:
+            self._build_price_index()
+    
     def get_prices(self) -> pd.DataFrame:
         """
         Get the cached prices DataFrame.
@@ -66,9 +217,79 @@ class DataLoader:
         Get list of available constituent symbols from the prices data.
         
         Returns:
-            list[str]: List of symbol names (column names excluding DATE)
+            list[str]: List of symbol names (column names excluding DATE).
+                       This is the shared cached list and must not be modified.
         """
-        if self._prices_df is None:
-            self.load_prices()
-        return [col for col in self._prices_df.columns if col != 'DATE']
-
+        self._ensure_price_index()
+        return self._symbols
+    
+    def get_matrix(self) -> np.ndarray:
+        """
+        Get the cached price matrix.
+        
+        Returns:
+            np.ndarray: Read-only float32 array of shape (dates, symbols),
+                        columns ordered as get_available_symbols()
+        """
+        self._ensure_price_index()
+        return self._matrix
+    
+    def get_latest_row(self) -> np.ndarray:
+        """
+        Get the prices on the most recent date at full precision.
+        
+        Returns:
+            np.ndarray: Read-only float64 array, columns ordered as get_available_symbols()
+        """
+        self._ensure_price_index()
+        return self._latest_row
+    
+    def get_dates(self) -> np.ndarray:
+        """
+        Get the cached dates in chronological order.
+        
+        Returns:
+            np.ndarray: Read-only datetime64 array, one entry per matrix row
+        """
+        self._ensure_price_index()
+        return self._dates
+    
+    def get_date_strings(self) -> List[str]:
+        """
+        Get the cached dates formatted as 'YYYY-MM-DD'.
+        
+        Returns:
+            List[str]: Shared list aligned with get_dates() (must not be modified)
+        """
+        self._ensure_price_index()
+        return self._date_strings
+    
+    def get_symbol_index(self) -> Dict[str, int]:
+        """
+        Get the mapping from symbol to its column in the price matrix.
+        
+        Returns:
+            Dict[str, int]: Shared symbol → column index map (must not be modified)
+        """
+        self._ensure_price_index()
+        return self._symbol_idx
+    
+    def get_symbol_set(self) -> FrozenSet[str]:
+        """
+        Get the available symbols as a set for O(1) membership tests.
+        
+        Returns:
+            FrozenSet[str]: Cached set of symbol names (column names excluding DATE)
+        """
+        self._ensure_price_index()
+        return self._symbol_set
+    
+    def get_data_version(self) -> int:
+        """
+        Get a number identifying the currently loaded prices.
+        
+        Returns:
+            int: Changes every time prices are (re)loaded, for keying derived caches
+        """
+        self._ensure_price_index()
+        return self._data_version
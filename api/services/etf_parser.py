@@ -3,13 +3,110 @@ ETF data parser service.
 Handles CSV parsing and format validation (not business rules).
 """
 
+import csv
+import hashlib
+import re
+import sys
+import threading
+import numpy as np
 import pandas as pd
 import io
-from typing import List, Dict, Any
+from cachetools import LRUCache
+from collections import Counter
+from collections.abc import Sequence
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import List, Dict, Any, Iterator, Optional, Tuple, Union
 from api.utils.logger import setup_logger
 
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+except ImportError:  # pragma: no cover - pandas is used as a fallback
+    pa = pacsv = None
+
 logger = setup_logger(__name__)
 
+# Columns every ETF file must have
+_REQUIRED_COLUMNS = frozenset(('name', 'weight'))
+
+# pyarrow's message for a cell that does not fit its column type,
+# e.g. "In CSV column #1: Row #2: CSV conversion error to double: ..."
+_CONVERSION_ERROR = re.compile(r'In CSV column #(\d+): .*CSV conversion error')
+
+# Weight cells read as missing (NaN). This is pyarrow's default list, passed
+# to both readers so they agree; names are always kept as written
+_NULL_VALUES = (
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan',
+    '1.#IND', '1.#QNAN', 'N/A', 'NA', 'NULL', 'NaN', 'n/a', 'nan', 'null'
+)
+
+
+@dataclass(frozen=True, eq=False)
+class Constituents(Sequence):
+    """
+    Parsed ETF constituents stored column-wise: one tuple of names and one
+    float64 array of weights, instead of a dict per row.
+    
+    Services read names and weights directly; indexing and iteration
+    still yield {'name': ..., 'weight': ...} dicts (built on access), so
+    code written for a list of dicts keeps working. Instances are
+    immutable and hashable, so they can be shared and used as cache keys.
+    
+    Attributes:
+        names: Constituent names in file order
+        weights: Read-only float64 array of weights (NaN where missing)
+    """
+    names: Tuple[str, ...]
+    weights: np.ndarray
+    
+    def __post_init__(self):
+        """Store the weights as a read-only float64 array."""
+        weights = np.array(self.weights, dtype=np.float64)
+        weights.flags.writeable = False
+        object.__setattr__(self, 'weights', weights)
+    
+    def __len__(self) -> int:
+        """Return the number of constituents."""
+        return len(self.names)
+    
+    def __getitem__(self, index: Union[int, slice]) -> Union[Dict[str, Any], List[Dict[str, Any]]]:
+        """Return the constituent at index as a dict (a list of dicts for a slice)."""
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        return {'name': self.names[index], 'weight': float(self.weights[index])}
+    
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        """Yield each constituent as a {'name', 'weight'} dict."""
+        for name, weight in zip(self.names, self.weights.tolist()):
+            yield {'name': name, 'weight': weight}
+    
+    def __eq__(self, other: object) -> bool:
+        """Compare with other Constituents (NaN weights equal) or a list of dicts."""
+        if isinstance(other, Constituents):
+            return self.names == other.names and np.array_equal(
+                self.weights, other.weights, equal_nan=True
+            )
+        if isinstance(other, (list, tuple)):
+            return list(self) == list(other)
+        return NotImplemented
+    
+    def __hash__(self) -> int:
+        """Hash the names and the weights, consistently with __eq__."""
+        # Canonical weight bytes: -0.0 == 0.0 and every NaN compares equal
+        # in __eq__, so they must hash alike
+        weights = np.where(np.isnan(self.weights), np.nan, self.weights + 0.0)
+        return hash((self.names, weights.tobytes()))
+    
+    @property
+    def nbytes(self) -> int:
+        """Approximate memory held by the names and weights, in bytes."""
+        return (
+            sys.getsizeof(self.names)
+            + sum(sys.getsizeof(name) for name in self.names)
+            + self.weights.nbytes
+        )
+
 
 class ETFDataParser:
     """
@@ -23,10 +120,48 @@ class ETFDataParser:
     Does NOT validate business rules (use ETFValidator for that).
     """
     
-    def parse_csv_file(self, content: bytes, filename: str = "uploaded_file") -> List[Dict[str, Any]]:
+    def __init__(self, max_upload_bytes: Optional[int] = None, cache_bytes: int = 0):
+        """
+        Initialize parser.
+        
+        Args:
+            max_upload_bytes: Largest accepted file size in bytes (None for no limit)
+            cache_bytes: Memory budget in bytes for parsed files kept by content
+                         hash, so identical uploads skip parsing (default: 0,
+                         no caching). Files parsing to more than the budget
+                         are not cached
+        """
+        self.max_upload_bytes = max_upload_bytes
+        
+        # Parsed constituents by SHA-256 of the file (immutable, so they are
+        # shared), bounded by their size in bytes rather than their count.
+        # Parsing runs in worker threads and cachetools caches are not
+        # thread-safe, hence the lock
+        self._cache = (
+            LRUCache(maxsize=cache_bytes, getsizeof=lambda c: c.nbytes)
+            if cache_bytes > 0 else None
+        )
+        self._cache_lock = threading.Lock()
+        
+        # pyarrow reader options are immutable, so build them once per parser
+        if pacsv is not None:
+            self._read_options = pacsv.ReadOptions(use_threads=False)
+            self._convert_options = pacsv.ConvertOptions(
+                column_types={'name': pa.string(), 'weight': pa.float64()},
+                null_values=list(_NULL_VALUES)
+            )
+    
+    def parse_csv_file(
+        self,
+        content: bytes,
+        filename: str = "uploaded_file",
+        content_digest: Optional[bytes] = None
+    ) -> Constituents:
         """
         Parse CSV file content and return standardized constituent data.
         
+        Uses pyarrow's CSV reader when available, falling back to pandas.
+        
         This method handles:
         1. CSV parsing
         2. Duplicate column name detection
@@ -37,63 +172,314 @@ class ETFDataParser:
         Args:
             content: Raw file content in bytes
             filename: Name of the file (for logging)
+            content_digest: SHA-256 digest of content, if the caller already
+                            computed it; used as the parse cache key
             
         Returns:
-            List of dicts with 'name' and 'weight' keys
+            Constituents with the names and weights (indexing yields
+            dicts with 'name' and 'weight' keys)
             
         Raises:
             ValueError: If file format is invalid
         """
         logger.info(f"Parsing ETF file: {filename} ({len(content)} bytes)")
         
-        # Step 1: Parse CSV
+        # Reject oversized uploads before any parsing work
+        if self.max_upload_bytes is not None and len(content) > self.max_upload_bytes:
+            raise ValueError(
+                f"File too large: {len(content)} bytes (maximum {self.max_upload_bytes} bytes)"
+            )
+        
+        if self._cache is not None:
+            key = content_digest or hashlib.sha256(content, usedforsecurity=False).digest()
+            with self._cache_lock:
+                cached = self._cache.get(key)
+            if cached is not None:
+                logger.info(f"Parsed constituents served from cache ({len(cached)} constituents)")
+                return cached
+        
+        if pacsv is not None:
+            constituents = self._parse_with_pyarrow(content)
+        else:
+            constituents = self._parse_with_pandas(content)
+        
+        # One large file must not evict every other entry or be pinned in
+        # memory, so anything over the whole budget is simply not cached
+        if self._cache is not None and constituents.nbytes <= self._cache.maxsize:
+            with self._cache_lock:
+                self._cache[key] = constituents
+        
+        logger.info(f"Successfully parsed {len(constituents)} constituents")
+        return constituents
+    
+    def _parse_with_pyarrow(self, content: bytes) -> Constituents:
+        """
+        Parse CSV bytes with pyarrow's CSV reader (no decode to str, no pandas).
+        
+        Args:
+            content: Raw file content in bytes
+            
+        Returns:
+            Constituents with the names and weights
+        """
+        # pyarrow rejects a header-only file without a line break as unparseable;
+        # terminate the line so it is reported as having no data rows instead
+        if content and b'\n' not in content:
+            content += b'\n'
+        
+        # Wrap the upload bytes as an Arrow buffer without copying them
+        buffer = pa.py_buffer(content)
+        
+        # Step 1: Parse CSV with declared column types, so names stay strings
+        # and weights are converted to float while parsing (empty cells
+        # become null, i.e. NaN); no type inference runs for these columns
         try:
-            df = pd.read_csv(io.StringIO(content.decode('utf-8')))
-            logger.debug(f"CSV parsed successfully: {len(df)} rows, {len(df.columns)} columns")
+            table = pacsv.read_csv(
+                pa.BufferReader(buffer),
+                read_options=self._read_options,
+                convert_options=self._convert_options
+            )
+            logger.debug(f"CSV parsed successfully: {table.num_rows} rows, {table.num_columns} columns")
+        except pa.ArrowInvalid as e:
+            # Step 5 happens during parsing: a weight that is not a number
+            # fails the float64 conversion. Other conversion errors (e.g. a
+            # name that is not valid UTF-8) are format errors
+            if self._failed_column(e, content) == 'weight':
+                try:
+                    text_df = self._read_weights_as_text_pyarrow(buffer)
+                except pa.ArrowInvalid as text_error:
+                    # Another column is unreadable too (e.g. a name that is not UTF-8)
+                    logger.error(f"Failed to parse CSV: {str(text_error)}")
+                    raise ValueError(f"Invalid CSV format: {str(text_error)}")
+                raise self._invalid_weight_error(text_df)
+            logger.error(f"Failed to parse CSV: {str(e)}")
+            raise ValueError(f"Invalid CSV format: {str(e)}")
         except Exception as e:
             logger.error(f"Failed to parse CSV: {str(e)}")
             raise ValueError(f"Invalid CSV format: {str(e)}")
         
-        # Step 2: Check for duplicate column names
+        # Step 2-3: Check for duplicate and required column names
+        columns = table.column_names
+        duplicates = [col for col, count in Counter(columns).items() if count > 1]
+        self._check_columns(columns, duplicates)
+        
+        # Step 4: Check for empty data
+        if table.num_rows == 0:
+            logger.warning("CSV file contains no data rows")
+            raise ValueError("CSV file is empty")
+        
+        # Step 6: Keep the columns as they are (nulls become NaN weights)
+        return Constituents(
+            names=tuple(table.column('name').to_pylist()),
+            weights=table.column('weight').to_numpy(zero_copy_only=False)
+        )
+    
+    def _parse_with_pandas(self, content: bytes) -> Constituents:
+        """
+        Parse CSV bytes with pandas (used when pyarrow is not installed).
+        
+        Args:
+            content: Raw file content in bytes
+            
+        Returns:
+            Constituents with the names and weights
+        """
+        # Step 1: Read just the header
+        try:
+            # The C engine decodes the bytes inline, no intermediate str copy
+            columns = list(pd.read_csv(io.BytesIO(content), encoding='utf-8', engine='c', nrows=0).columns)
+        except Exception as e:
+            logger.error(f"Failed to parse CSV: {str(e)}")
+            raise ValueError(f"Invalid CSV format: {str(e)}")
+        
+        # Step 2-3: Check for duplicate and required column names
         # Pandas auto-renames duplicates (e.g., 'name' -> 'name.1')
-        duplicate_indicators = [col for col in df.columns if '.' in str(col) and str(col).split('.')[-1].isdigit()]
-        if duplicate_indicators:
-            # Extract original column names by removing the .N suffix
-            original_names = [col.rsplit('.', 1)[0] for col in duplicate_indicators]
-            logger.warning(f"Duplicate column names detected: {original_names}")
-            raise ValueError(
-                f"CSV contains duplicate column names: {', '.join(set(original_names))}. "
-                f"Each column name must be unique."
-            )
+        duplicate_indicators = [col for col in columns if '.' in str(col) and str(col).split('.')[-1].isdigit()]
+        # Extract original column names by removing the .N suffix
+        duplicates = list(dict.fromkeys(col.rsplit('.', 1)[0] for col in duplicate_indicators))
+        self._check_columns(columns, duplicates)
         
-        # Step 3: Validate required columns
-        required_columns = {'name', 'weight'}
-        actual_columns = set(df.columns)
+        # Reject ragged rows like the pyarrow reader (pandas would pad short
+        # rows with NaN and silently drop the extra fields of long ones)
+        self._check_row_lengths(content, len(columns))
         
-        if not required_columns.issubset(actual_columns):
-            missing = required_columns - actual_columns
-            logger.warning(f"Missing required columns: {missing}. Found: {list(actual_columns)}")
-            raise ValueError(
-                f"CSV must contain 'name' and 'weight' columns. "
-                f"Found: {list(actual_columns)}"
+        # Parse only the two required columns as text, so other columns are
+        # never materialized. Names stay exactly as written ('' and 'NA' are
+        # names, not missing); only weight cells in _NULL_VALUES become NaN
+        try:
+            df = pd.read_csv(
+                io.BytesIO(content),
+                encoding='utf-8',
+                engine='c',
+                usecols=['name', 'weight'],
+                dtype=str,
+                keep_default_na=False,
+                na_values={'weight': list(_NULL_VALUES)},
+                low_memory=False
             )
+            logger.debug(f"CSV parsed successfully: {len(df)} rows, {len(columns)} columns")
+        except (pd.errors.ParserError, UnicodeDecodeError) as e:
+            logger.error(f"Failed to parse CSV: {str(e)}")
+            raise ValueError(f"Invalid CSV format: {str(e)}")
+        
+        # Step 5: Convert weights to float. to_numeric is stricter than the C
+        # parser's float conversion, which would read true/false as 1.0/0.0
+        weights = pd.to_numeric(df['weight'], errors='coerce').to_numpy(dtype=np.float64)
+        if np.isnan(weights).sum() != df['weight'].isna().sum():
+            raise self._invalid_weight_error(df)
         
         # Step 4: Check for empty data
         if len(df) == 0:
             logger.warning("CSV file contains no data rows")
             raise ValueError("CSV file is empty")
         
-        # Step 5: Convert to list of dicts
-        constituents = df[['name', 'weight']].to_dict('records')
+        # Step 6: Keep the columns as they are
+        return Constituents(
+            names=tuple(df['name'].to_numpy(dtype=object).tolist()),
+            weights=weights
+        )
+    
+    @staticmethod
+    def _failed_column(error: Exception, content: bytes) -> Optional[str]:
+        """
+        Find the column a pyarrow conversion error refers to.
         
-        # Step 6: Convert weights to float
+        Args:
+            error: Exception raised by the pyarrow CSV reader
+            content: Raw file content in bytes
+            
+        Returns:
+            Name of the column whose value failed to convert, or None if the
+            error is not a conversion error
+        """
+        match = _CONVERSION_ERROR.match(str(error))
+        if match is None:
+            return None
+        # The reader takes column names from the first line
+        header_line = content.split(b'\n', 1)[0].decode('utf-8', errors='replace')
+        header = next(csv.reader([header_line]), [])
+        index = int(match.group(1))
+        return header[index] if index < len(header) else None
+    
+    def _read_weights_as_text_pyarrow(self, buffer: "pa.Buffer") -> pd.DataFrame:
+        """
+        Re-read the name and weight columns as text (error path only).
+        
+        Args:
+            buffer: Arrow buffer over the raw file content
+            
+        Returns:
+            DataFrame of 'name' and 'weight' strings; cells pyarrow treats as
+            null (empty, 'NA', 'nan', ...) are missing
+        """
+        table = pacsv.read_csv(
+            pa.BufferReader(buffer),
+            read_options=self._read_options,
+            convert_options=pacsv.ConvertOptions(
+                column_types={'name': pa.string(), 'weight': pa.string()},
+                include_columns=['name', 'weight'],
+                null_values=list(_NULL_VALUES),
+                strings_can_be_null=True
+            )
+        )
+        return table.to_pandas()
+    
+    @staticmethod
+    def _check_row_lengths(content: bytes, expected: int) -> None:
+        """
+        Reject rows whose field count differs from the header's.
+        
+        Args:
+            content: Raw file content in bytes
+            expected: Number of columns in the header
+            
+        Raises:
+            ValueError: For the first ragged row, worded like pyarrow's error
+        """
+        # Decode incrementally rather than copying the whole file into a str;
+        # blank lines are skipped by both readers, so they are skipped here
+        text = io.TextIOWrapper(io.BytesIO(content), encoding='utf-8', newline='')
         try:
-            for constituent in constituents:
-                constituent['weight'] = float(constituent['weight'])
-        except (ValueError, TypeError) as e:
-            logger.warning(f"Invalid weight value: {str(e)}")
-            raise ValueError(f"All weights must be numeric values. Error: {str(e)}")
+            rows = (fields for fields in csv.reader(text) if fields)
+            for row_number, fields in enumerate(rows, start=1):
+                if len(fields) != expected:
+                    raise ValueError(
+                        f"Invalid CSV format: CSV parse error: Row #{row_number}: "
+                        f"Expected {expected} columns, got {len(fields)}"
+                    )
+        except (csv.Error, UnicodeDecodeError) as e:
+            logger.error(f"Failed to parse CSV: {str(e)}")
+            raise ValueError(f"Invalid CSV format: {str(e)}")
+    
+    @staticmethod
+    def _invalid_weight_error(text_df: pd.DataFrame) -> ValueError:
+        """
+        Build the error for the first weight that is present but not a number.
         
-        logger.info(f"Successfully parsed {len(constituents)} constituents")
-        return constituents
+        Args:
+            text_df: 'name' and 'weight' columns read as text, with missing cells as NA
+            
+        Returns:
+            ValueError naming the offending constituent
+        """
+        raw = text_df['weight']
+        weights = pd.to_numeric(raw, errors='coerce').to_numpy(dtype=np.float64)
+        present = (raw.notna() & (raw.str.strip() != '')).to_numpy(dtype=bool)
+        bad = np.isnan(weights) & present
+        
+        if not bad.any():
+            return ValueError("All weights must be numeric values.")
+        
+        i = int(bad.argmax())
+        name, value = text_df['name'].iloc[i], raw.iloc[i]
+        logger.warning(f"Invalid weight value for {name!r}: {value!r}")
+        return ValueError(
+            f"All weights must be numeric values. "
+            f"Weight for '{name}' must be numeric, got {value!r}"
+        )
+    
+    def _check_columns(self, columns: List[str], duplicates: List[str]) -> None:
+        """
+        Validate the CSV header.
+        
+        Args:
+            columns: Column names as parsed
+            duplicates: Column names that appear more than once
+            
+        Raises:
+            ValueError: If a column name is duplicated or 'name'/'weight' is missing
+        """
+        if duplicates:
+            logger.warning(f"Duplicate column names detected: {duplicates}")
+            raise ValueError(
+                f"CSV contains duplicate column names: {', '.join(duplicates)}. "
+                f"Each column name must be unique."
+            )
+        
+        actual_columns = set(columns)
+        
+        if not _REQUIRED_COLUMNS.issubset(actual_columns):
+            missing = _REQUIRED_COLUMNS - actual_columns
+            logger.warning(f"Missing required columns: {sorted(missing)}. Found: {list(actual_columns)}")
+            raise ValueError(
+                f"CSV must contain 'name' and 'weight' columns. "
+                f"Found: {list(actual_columns)}"
+            )
 
+
+@lru_cache(maxsize=None)
+def get_parser(max_upload_bytes: Optional[int] = None, cache_bytes: int = 0) -> ETFDataParser:
+    """
+    Return the shared parser for the given settings.
+    
+    The parser holds no per-request state, so one instance per settings is
+    created and reused along with its reader options and parse cache.
+    
+    Args:
+        max_upload_bytes: Largest accepted file size in bytes (None for no limit)
+        cache_bytes: Memory budget of the parse cache in bytes (0 disables)
+        
+    Returns:
+        ETFDataParser: Cached parser instance
+    """
+    return ETFDataParser(max_upload_bytes=max_upload_bytes, cache_bytes=cache_bytes)
@@ -3,7 +3,125 @@ Validator service for ETF data validation.
 Ensures data quality and provides clear error messages to users.
 """
 
-from typing import List, Dict, Any, Tuple
+import heapq
+import math
+import sys
+import threading
+import numpy as np
+from cachetools import LRUCache
+from collections import Counter
+from typing import List, Dict, Any, Tuple, AbstractSet, FrozenSet, Hashable, Iterable, Optional, Sequence, Union
+from ._kernels import check_ranges
+from .etf_parser import Constituents
+
+
+# Memory budget in bytes of the validate_all memo; entries are keyed by the
+# caller's small cache key and hold only the error messages
+VALIDATION_CACHE_BYTES = 4 * 1024 * 1024
+
+# Above this many weights the range check first runs the compiled
+# single-pass kernel; smaller lists are not worth the call overhead
+KERNEL_MIN_WEIGHTS = 256
+
+# Shared success results; tuples are immutable, so no per-call allocation is needed.
+# The missing-symbols slot is an empty tuple because a shared list could be mutated.
+_OK_2: Tuple[bool, str] = (True, "")
+_OK_3: Tuple[bool, str, Tuple[str, ...]] = (True, "", ())
+
+# Reasons shown for each invalid weight
+_NEGATIVE = "negative weight"
+_ABOVE_ONE = "exceeds 100%"
+_MISSING = "missing or not a number"
+
+
+def _as_symbol_set(symbols: Iterable[str]) -> AbstractSet[str]:
+    """Return symbols as a set for O(1) membership tests, reusing it if it already is one."""
+    if isinstance(symbols, (set, frozenset)):
+        return symbols
+    return frozenset(symbols)
+
+
+def _find_duplicates(symbols: List[str]) -> List[str]:
+    """Return symbols that occur more than once (empty list if none)."""
+    # Fast path: no duplicates if the set is as long as the list
+    if len(set(symbols)) == len(symbols):
+        return []
+    # Counter tallies in C, no per-element Python branch
+    return [symbol for symbol, count in Counter(symbols).items() if count > 1]
+
+
+def _find_missing(names: Iterable[str], available: AbstractSet[str]) -> List[str]:
+    """Return names not in the available symbols, in input order."""
+    return [symbol for symbol in names if symbol not in available]
+
+
+def _names(constituents: Sequence[Dict[str, Any]]) -> Sequence[str]:
+    """Return constituent names, reusing the names of parsed Constituents."""
+    if isinstance(constituents, Constituents):
+        return constituents.names
+    return [c['name'] for c in constituents]
+
+
+def _raw_weights(constituents: Sequence[Dict[str, Any]]) -> List[Any]:
+    """Return constituent weights as given (native floats for parsed Constituents)."""
+    if isinstance(constituents, Constituents):
+        return constituents.weights.tolist()
+    return [c['weight'] for c in constituents]
+
+
+def _weights_array(constituents: Sequence[Dict[str, Any]]) -> np.ndarray:
+    """Extract constituent weights into a float64 array in one pass."""
+    if isinstance(constituents, Constituents):
+        return constituents.weights
+    return np.fromiter(
+        (c['weight'] for c in constituents), dtype=np.float64, count=len(constituents)
+    )
+
+
+def _result_nbytes(result: Tuple[bool, Tuple[str, ...]]) -> int:
+    """Approximate memory held by a memoized validate_all result, in bytes."""
+    errors = result[1]
+    return sys.getsizeof(result) + sys.getsizeof(errors) + sum(sys.getsizeof(e) for e in errors)
+
+
+def _materialize(pairs: Sequence[Tuple[str, Any]]) -> Tuple[List[str], np.ndarray]:
+    """Split (name, weight) pairs into a name list and a float64 weight array."""
+    names = [name for name, _ in pairs]
+    weights = np.fromiter((weight for _, weight in pairs), dtype=np.float64, count=len(pairs))
+    return names, weights
+
+
+def _find_invalid_weights(
+    names: Sequence[str], weights: np.ndarray, raw_weights: Sequence[Any]
+) -> List[Tuple[str, Any, str]]:
+    """
+    Return (symbol, weight, reason) for every weight that is NaN or outside [0, 1].
+    
+    The checks run as array masks; Python only walks the invalid entries,
+    reporting each weight as given (raw_weights) rather than as a float.
+    """
+    # Large lists: one compiled pass finds the first invalid weight (if
+    # any), and the masks below only cover the weights from there on
+    first = 0
+    if len(weights) > KERNEL_MIN_WEIGHTS:
+        first = check_ranges(weights)
+        if first < 0:
+            return []
+    
+    tail = weights[first:]
+    nan_mask = np.isnan(tail)
+    neg_mask = tail < 0
+    hi_mask = tail > 1
+    bad = np.flatnonzero(nan_mask | neg_mask | hi_mask).tolist()
+    
+    return [
+        (
+            names[first + i],
+            raw_weights[first + i],
+            _MISSING if nan_mask[i] else _NEGATIVE if neg_mask[i] else _ABOVE_ONE
+        )
+        for i in bad
+    ]
 
 
 class ETFValidator:
@@ -12,7 +130,7 @@ class ETFValidator:
     
     This class performs various checks on ETF data before processing:
     - Weight sum validation (should equal 1.0)
-    - Weight range validation (0 to 1)
+    - Weight range validation (0 to 1, no missing values)
     - Symbol existence validation
     """
     
@@ -25,8 +143,19 @@ class ETFValidator:
                       For example, with tolerance=0.02, values from 0.98 to 1.02 are acceptable
         """
         self.tolerance = tolerance
+        # validate_all results by caller cache key, bounded by size in bytes.
+        # The keys are small (e.g. an upload digest), so neither constituents
+        # nor symbol sets are kept alive; validate_all runs in worker threads,
+        # hence the lock
+        self._results = LRUCache(maxsize=VALIDATION_CACHE_BYTES, getsizeof=_result_nbytes)
+        self._results_lock = threading.Lock()
     
-    def validate_weights_sum(self, constituents: List[Dict[str, Any]]) -> Tuple[bool, str]:
+    def clear_cache(self) -> None:
+        """Drop all memoized validate_all results."""
+        with self._results_lock:
+            self._results.clear()
+    
+    def validate_weights_sum(self, constituents: Sequence[Dict[str, Any]]) -> Tuple[bool, str]:
         """
         Validate that weights sum to approximately 1.0.
         
@@ -35,64 +164,51 @@ class ETFValidator:
         - Incorrect sum indicates data error or incomplete data
         
         Args:
-            constituents: List of dicts with 'name' and 'weight' keys
+            constituents: List of dicts with 'name' and 'weight' keys, or parsed Constituents
             
         Returns:
             Tuple of (is_valid, error_message)
             - (True, "") if valid
             - (False, "error message") if invalid
         """
-        total_weight = sum(c['weight'] for c in constituents)
+        # fsum is exactly rounded, so accumulated drift can never push a
+        # correct ETF outside a tight tolerance
+        total_weight = math.fsum(_raw_weights(constituents))
         
         # Check if within tolerance
         if abs(total_weight - 1.0) > self.tolerance:
-            return (
-                False,
-                f"Weight sum validation failed: weights sum to {total_weight:.4f}, "
-                f"expected 1.0 ± {self.tolerance}. "
-                f"Please ensure all constituent weights add up to 100%."
-            )
+            return (False, self._format_sum_error(total_weight))
         
-        return (True, "")
+        return _OK_2
     
-    def validate_weight_ranges(self, constituents: List[Dict[str, Any]]) -> Tuple[bool, str]:
+    def validate_weight_ranges(self, constituents: Sequence[Dict[str, Any]]) -> Tuple[bool, str]:
         """
         Validate that all weights are in valid range [0, 1].
         
         Why this matters:
         - Negative weights don't make sense in ETF context
         - Weights > 1 would mean more than 100% allocation to one stock
+        - Empty weight cells are parsed as NaN and would poison the ETF price
         
         Args:
-            constituents: List of dicts with 'name' and 'weight' keys
+            constituents: List of dicts with 'name' and 'weight' keys, or parsed Constituents
             
         Returns:
             Tuple of (is_valid, error_message)
         """
-        invalid_weights = []
-        
-        for constituent in constituents:
-            weight = constituent['weight']
-            symbol = constituent['name']
-            
-            if weight < 0:
-                invalid_weights.append(f"{symbol}: {weight} (negative weight)")
-            elif weight > 1:
-                invalid_weights.append(f"{symbol}: {weight} (exceeds 100%)")
-        
+        invalid_weights = _find_invalid_weights(
+            _names(constituents), _weights_array(constituents), _raw_weights(constituents)
+        )
         if invalid_weights:
-            return (
-                False,
-                f"Invalid weight values detected:\n" + "\n".join(f"  - {w}" for w in invalid_weights)
-            )
+            return (False, self._format_range_error(invalid_weights))
         
-        return (True, "")
+        return _OK_2
     
     def validate_symbols_exist(
         self, 
-        constituents: List[Dict[str, Any]], 
-        available_symbols: List[str]
-    ) -> Tuple[bool, str, List[str]]:
+        constituents: Sequence[Dict[str, Any]], 
+        available_symbols: Union[List[str], FrozenSet[str]]
+    ) -> Tuple[bool, str, Sequence[str]]:
         """
         Validate that all constituent symbols exist in price data.
         
@@ -101,33 +217,30 @@ class ETFValidator:
         - User should know immediately if data is missing
         
         Args:
-            constituents: List of dicts with 'name' and 'weight' keys
-            available_symbols: List of available stock symbols
+            constituents: List of dicts with 'name' and 'weight' keys, or parsed Constituents
+            available_symbols: Available stock symbols; pass the frozenset cached by
+                               DataLoader.get_symbol_set() to skip the set conversion
             
         Returns:
             Tuple of (is_valid, error_message, missing_symbols)
             - is_valid: True if all symbols exist
             - error_message: Description of missing symbols
-            - missing_symbols: List of symbols not found
+            - missing_symbols: List of symbols not found (empty tuple if none)
         """
-        missing_symbols = []
-        
-        for constituent in constituents:
-            symbol = constituent['name']
-            if symbol not in available_symbols:
-                missing_symbols.append(symbol)
+        # Hash lookups instead of scanning the list for every constituent
+        available = _as_symbol_set(available_symbols)
+        missing_symbols = _find_missing(_names(constituents), available)
         
         if missing_symbols:
             return (
                 False,
-                f"The following symbols were not found in price data: {', '.join(missing_symbols)}. "
-                f"Available symbols: {', '.join(sorted(available_symbols)[:10])}...",
+                self._format_missing_error(missing_symbols, available),
                 missing_symbols
             )
         
-        return (True, "", [])
+        return _OK_3
     
-    def validate_non_empty(self, constituents: List[Dict[str, Any]]) -> Tuple[bool, str]:
+    def validate_non_empty(self, constituents: Sequence[Dict[str, Any]]) -> Tuple[bool, str]:
         """
         Validate that constituents list is not empty.
         
@@ -140,9 +253,9 @@ class ETFValidator:
         if not constituents or len(constituents) == 0:
             return (False, "ETF must have at least one constituent")
         
-        return (True, "")
+        return _OK_2
     
-    def validate_no_duplicates(self, constituents: List[Dict[str, Any]]) -> Tuple[bool, str]:
+    def validate_no_duplicates(self, constituents: Sequence[Dict[str, Any]]) -> Tuple[bool, str]:
         """
         Validate that there are no duplicate symbols.
         
@@ -158,28 +271,18 @@ class ETFValidator:
             - (True, "") if no duplicates
             - (False, "error message") if duplicates found
         """
-        symbols = [c['name'] for c in constituents]
-        seen = set()
-        duplicates = set()
-        
-        for symbol in symbols:
-            if symbol in seen:
-                duplicates.add(symbol)
-            seen.add(symbol)
-        
+        duplicates = _find_duplicates(_names(constituents))
         if duplicates:
-            dup_list = sorted(list(duplicates))
-            return (
-                False,
-                f"Duplicate symbols found: {', '.join(dup_list)}"
-            )
+            return (False, self._format_duplicate_error(duplicates))
         
-        return (True, "")
+        return _OK_2
     
     def validate_all(
         self, 
-        constituents: List[Dict[str, Any]], 
-        available_symbols: List[str]
+        constituents: Sequence[Dict[str, Any]], 
+        available_symbols: Union[List[str], FrozenSet[str]],
+        fail_fast: bool = False,
+        cache_key: Optional[Hashable] = None
     ) -> Tuple[bool, List[str]]:
         """
         Run all validations and collect errors.
@@ -188,13 +291,20 @@ class ETFValidator:
         and returns a comprehensive list of all errors found.
         
         Args:
-            constituents: List of dicts with 'name' and 'weight' keys
-            available_symbols: List of available stock symbols
+            constituents: List of dicts with 'name' and 'weight' keys, or parsed Constituents
+            available_symbols: Available stock symbols; pass the frozenset cached by
+                               DataLoader.get_symbol_set() to skip the set conversion
+            fail_fast: Stop at the first failing check, for callers that only need
+                       to know whether the data is valid (default: False)
+            cache_key: Small hashable value identifying both the constituents and
+                       the available symbols, e.g. (upload digest, data version);
+                       results are memoized under it (default: None, no memo)
             
         Returns:
             Tuple of (is_valid, error_messages)
             - is_valid: True only if ALL validations pass
-            - error_messages: List of all error messages (empty if valid)
+            - error_messages: List of all error messages (empty if valid),
+              at most one when fail_fast is set
             
         Example:
             is_valid, errors = validator.validate_all(constituents, symbols)
@@ -209,25 +319,111 @@ class ETFValidator:
             errors.append(msg)
             return (False, errors)  # No point continuing if empty
         
-        # Check 2: No duplicates
-        valid, msg = self.validate_no_duplicates(constituents)
-        if not valid:
-            errors.append(msg)
+        # Checks 2-5 are memoized on the caller's key, so identical uploads
+        # (re-uploads, retries) skip the work entirely
+        if cache_key is not None:
+            key = (cache_key, self.tolerance, fail_fast)
+            with self._results_lock:
+                cached = self._results.get(key)
+            if cached is not None:
+                return (cached[0], list(cached[1]))
         
-        # Check 3: Weight ranges
-        valid, msg = self.validate_weight_ranges(constituents)
-        if not valid:
-            errors.append(msg)
+        if not isinstance(constituents, Constituents):
+            constituents = tuple((c['name'], c['weight']) for c in constituents)
+        available = _as_symbol_set(available_symbols)
         
-        # Check 4: Weight sum
-        valid, msg = self.validate_weights_sum(constituents)
-        if not valid:
-            errors.append(msg)
+        result = self._run_checks(constituents, available, self.tolerance, fail_fast)
         
-        # Check 5: Symbol existence
-        valid, msg, _ = self.validate_symbols_exist(constituents, available_symbols)
-        if not valid:
-            errors.append(msg)
+        # A result larger than the whole budget (a huge missing-symbols
+        # message) is not memoized
+        if cache_key is not None and _result_nbytes(result) <= self._results.maxsize:
+            with self._results_lock:
+                self._results[key] = result
+        return (result[0], list(result[1]))
+    
+    def _run_checks(
+        self,
+        constituents: Union[Constituents, Tuple[Tuple[str, Any], ...]],
+        available: AbstractSet[str],
+        tolerance: float,
+        fail_fast: bool
+    ) -> Tuple[bool, Tuple[str, ...]]:
+        """
+        Run checks 2-5 of validate_all on arrays built once from the input:
+        duplicates are counted in C, ranges are array masks, the sum is an
+        exact fsum and symbols are set lookups.
         
-        return (len(errors) == 0, errors)
-
+        Args:
+            constituents: Parsed Constituents, or a tuple of (name, weight) pairs
+            available: Set of available stock symbols
+            tolerance: Weight sum tolerance
+            fail_fast: Return at the first failing check, skipping the remaining checks
+            
+        Returns:
+            Tuple of (is_valid, error_messages) with errors as an immutable tuple
+        """
+        errors = []
+        if isinstance(constituents, Constituents):
+            names, weights = constituents.names, constituents.weights
+            raw_weights = weights.tolist()
+        else:
+            names, weights = _materialize(constituents)
+            raw_weights = [weight for _, weight in constituents]
+        
+        # Checks run in the same order as the individual validators; with
+        # fail_fast the first error returns before the later checks run
+        duplicates = _find_duplicates(names)
+        if duplicates:
+            errors.append(self._format_duplicate_error(duplicates))
+            if fail_fast:
+                return (False, tuple(errors))
+        
+        invalid_weights = _find_invalid_weights(names, weights, raw_weights)
+        if invalid_weights:
+            errors.append(self._format_range_error(invalid_weights))
+            if fail_fast:
+                return (False, tuple(errors))
+        
+        total_weight = math.fsum(weights.tolist())
+        if abs(total_weight - 1.0) > tolerance:
+            errors.append(self._format_sum_error(total_weight))
+            if fail_fast:
+                return (False, tuple(errors))
+        
+        missing_symbols = _find_missing(names, available)
+        if missing_symbols:
+            errors.append(self._format_missing_error(missing_symbols, available))
+        
+        return (len(errors) == 0, tuple(errors))
+    
+    # Error message formatting shared by the individual checks and validate_all
+    
+    def _format_sum_error(self, total_weight: float) -> str:
+        """Build the error message for weights not summing to 1.0."""
+        return (
+            f"Weight sum validation failed: weights sum to {total_weight:.4f}, "
+            f"expected 1.0 ± {self.tolerance}. "
+            f"Please ensure all constituent weights add up to 100%."
+        )
+    
+    @staticmethod
+    def _format_range_error(invalid_weights: List[Tuple[str, Any, str]]) -> str:
+        """Build the error message from (symbol, weight, reason) tuples."""
+        lines = [
+            f"  - {symbol}: {weight} ({reason})"
+            for symbol, weight, reason in invalid_weights
+        ]
+        return "Invalid weight values detected:\n" + "\n".join(lines)
+    
+    @staticmethod
+    def _format_missing_error(missing_symbols: List[str], available_symbols: Iterable[str]) -> str:
+        """Build the error message for symbols missing from the price data (error path only)."""
+        return (
+            f"The following symbols were not found in price data: {', '.join(missing_symbols)}. "
+            f"Available symbols: {', '.join(heapq.nsmallest(10, available_symbols))}..."
+        )
+    
+    @staticmethod
+    def _format_duplicate_error(duplicates: Iterable[str]) -> str:
+        """Build the error message for duplicate symbols."""
+        return f"Duplicate symbols found: {', '.join(sorted(duplicates))}"
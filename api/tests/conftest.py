@@ -5,6 +5,9 @@ This file contains fixtures that are available to all tests.
 Fixtures are reusable components that help set up test conditions.
 """
 
+import functools
+import io
+import os
 import pytest
 import pandas as pd
 from pathlib import Path
@@ -15,15 +18,20 @@ import sys
 # Add the parent directory to the path so we can import api modules
 sys.path.insert(0, str(Path(__file__).parent.parent.parent))
 
+# Loggers are configured when the api modules are imported (before any test
+# runs), so switch them to quiet test mode first
+os.environ.setdefault('ETF_TEST_MODE', '1')
+
 from api.services import DataLoader, ETFCalculator
 from api.index import app
+from api.routers import etf_router
 
 
 # =============================================================================
 # Path Fixtures - Provide paths to test data files
 # =============================================================================
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def test_data_dir():
     """
     Returns the path to the test_data directory.
@@ -32,7 +40,7 @@ def test_data_dir():
     return Path(__file__).parent / "test_data"
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def test_prices_csv(test_data_dir):
     """
     Returns the path to the test prices CSV file.
@@ -41,7 +49,7 @@ def test_prices_csv(test_data_dir):
     return test_data_dir / "test_prices.csv"
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def test_etf_valid_csv(test_data_dir):
     """
     Returns the path to a valid ETF constituents CSV file.
@@ -50,7 +58,7 @@ def test_etf_valid_csv(test_data_dir):
     return test_data_dir / "test_etf_valid.csv"
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def test_etf_invalid_csv(test_data_dir):
     """
     Returns the path to an invalid ETF constituents CSV file.
@@ -63,89 +71,101 @@ def test_etf_invalid_csv(test_data_dir):
 # DataLoader Fixtures - Provide test instances of DataLoader
 # =============================================================================
 
-@pytest.fixture
-def mock_data_loader(test_prices_csv):
+@pytest.fixture(scope="session")
+def test_prices_df(test_prices_csv):
     """
-    Creates a DataLoader instance that uses test data instead of real data.
+    Provides the test prices as a pandas DataFrame.
     
-    This fixture uses Python's 'patch' to temporarily replace the real
-    prices.csv path with our test data path.
-    
-    Why mock? We want tests to:
-    1. Run fast (small test data)
-    2. Be predictable (known test values)
-    3. Not depend on external files that might change
+    Useful for tests that need direct access to the data
+    without going through DataLoader. The CSV is parsed once per test
+    session and the DataFrame is shared, so tests must not modify it.
     """
-    # Reset the DataLoader singleton before each test
-    DataLoader._instance = None
-    DataLoader._prices_df = None
-    
-    # Create a custom load function that uses test data
-    original_load = DataLoader.load_prices
-    
-    def load_test_prices(self):
-        """Load test prices instead of real prices."""
-        self._prices_df = pd.read_csv(test_prices_csv)
-        self._prices_df['DATE'] = pd.to_datetime(self._prices_df['DATE'])
-        self._prices_df = self._prices_df.sort_values('DATE').reset_index(drop=True)
-    
-    # Temporarily replace the load_prices method
-    DataLoader.load_prices = load_test_prices
+    df = pd.read_csv(test_prices_csv, engine='c', parse_dates=['DATE'])
+    return df.sort_values('DATE').reset_index(drop=True)
+
+
+@pytest.fixture(scope="session")
+def last_row(test_prices_df):
+    """
+    Provides the last (latest) row of the test prices as a dict,
+    e.g. {'DATE': Timestamp('2024-01-05'), 'A': 104.0, ...}.
+    """
+    return test_prices_df.iloc[-1].to_dict()
+
+
+@pytest.fixture(scope="session")
+def price_columns(test_prices_df):
+    """
+    Provides the column names of the test prices, DATE first.
+    """
+    return list(test_prices_df.columns)
+
+
+@pytest.fixture(scope="session")
+def _test_data_loader(test_prices_df):
+    """
+    Builds a DataLoader holding the test prices once per test session.
     
-    try:
-        loader = DataLoader()
-        yield loader
-    finally:
-        # Clean up: Reset singleton and restore original method
-        DataLoader.load_prices = original_load
-        DataLoader._instance = None
-        DataLoader._prices_df = None
+    The instance is created without going through the singleton, so the
+    real price data is never read. Its arrays are read-only and get_prices()
+    returns copies, so sharing it between tests is safe.
+    Do not use directly in tests; request mock_data_loader instead.
+    """
+    loader = object.__new__(DataLoader)
+    loader._prices_df = test_prices_df.copy()
+    loader._build_price_index()
+    return loader
 
 
 @pytest.fixture
-def test_prices_df(test_prices_csv):
+def mock_data_loader(_test_data_loader, monkeypatch):
     """
-    Loads the test prices CSV as a pandas DataFrame.
+    Provides a DataLoader that uses test data instead of real data.
     
-    Useful for tests that need direct access to the data
-    without going through DataLoader.
+    The shared test loader is installed as the DataLoader singleton for
+    the duration of the test, so DataLoader() returns it too. The previous
+    singleton is restored afterwards.
+    
+    Why mock? We want tests to:
+    1. Run fast (small test data)
+    2. Be predictable (known test values)
+    3. Not depend on external files that might change
     """
-    df = pd.read_csv(test_prices_csv)
-    df['DATE'] = pd.to_datetime(df['DATE'])
-    return df
+    monkeypatch.setattr(DataLoader, '_instance', _test_data_loader)
+    return _test_data_loader
 
 
 # =============================================================================
 # Calculator Fixtures - Provide test instances of ETFCalculator
 # =============================================================================
 
-@pytest.fixture
-def mock_calculator(mock_data_loader):
+@pytest.fixture(scope="session")
+def mock_calculator(_test_data_loader):
     """
     Creates an ETFCalculator instance that uses mocked test data.
     
-    This calculator will use the mock_data_loader, so all calculations
-    will be based on our small test dataset.
+    This calculator will use the shared test DataLoader, so all calculations
+    will be based on our small test dataset. The calculator holds no
+    per-request state, so one instance serves the whole session.
     """
     # Patch the DataLoader inside Calculator to use our mock
-    with patch('api.services.calculator.DataLoader', return_value=mock_data_loader):
+    with patch('api.services.calculator.DataLoader', return_value=_test_data_loader):
         calculator = ETFCalculator()
-        # Override the data_loader attribute
-        calculator.data_loader = mock_data_loader
-        yield calculator
+    return calculator
 
 
 # =============================================================================
 # Test Data Fixtures - Provide sample constituents data
 # =============================================================================
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def sample_constituents():
     """
     Provides sample ETF constituents data for testing.
     
     This matches the stocks in test_prices.csv with known weights.
     Format: [{'name': 'A', 'weight': 0.3}, ...]
+    Shared by the whole session; tests must not modify it.
     """
     return [
         {'name': 'A', 'weight': 0.3},
@@ -175,24 +195,58 @@ def sample_constituents_with_unknown():
 # API Test Fixtures - Provide FastAPI test client
 # =============================================================================
 
-@pytest.fixture
-def test_client(mock_data_loader):
+@pytest.fixture(scope="session")
+def test_client():
     """
     Provides a FastAPI test client for integration testing.
     
     TestClient allows us to make HTTP requests to the API
-    without actually starting a server.
+    without actually starting a server. The app and its router services
+    are built once at import, so a single client is shared by the whole
+    session; per-test state is reset by reset_response_cache.
     
     Usage in tests:
         response = test_client.post("/api/py/v1/etfs", files=...)
         assert response.status_code == 200
     """
-    # Patch DataLoader in the actual router module
-    with patch('api.routers.etf_router.DataLoader', return_value=mock_data_loader):
-        # Also patch the calculator's DataLoader
-        with patch('api.services.calculator.DataLoader', return_value=mock_data_loader):
-            client = TestClient(app)
-            yield client
+    return TestClient(app)
+
+
+def _post_csv(client, body, name='etf.csv'):
+    """
+    Uploads CSV bytes to the ETF analysis endpoint.
+    
+    Args:
+        client: FastAPI test client
+        body: CSV file content
+        name: Filename sent with the upload
+    
+    Returns:
+        The HTTP response
+    """
+    return client.post('/api/py/v1/etfs', files={'file': (name, io.BytesIO(body), 'text/csv')})
+
+
+@pytest.fixture(scope="session")
+def post_csv(test_client):
+    """
+    Provides a function that uploads CSV bytes through the shared client.
+    
+    Usage in tests:
+        response = post_csv(b"name,weight\nA,1.0")
+        assert response.status_code == 200
+    """
+    return functools.partial(_post_csv, test_client)
+
+
+@pytest.fixture(autouse=True)
+def reset_response_cache():
+    """
+    Clears the router's analysis response cache after every test, so a
+    response cached by one test is never served to the next.
+    """
+    yield
+    etf_router._response_cache.clear()
 
 
 # =============================================================================
@@ -190,8 +190,8 @@ class TestETFEndpoint:
         Sends invalid CSV data that can't be parsed.
         """
         # Create malformed CSV content
-        malformed_csv = "this is not,a valid\ncsv file!!!"
-        files = {'file': ('malformed.csv', io.BytesIO(malformed_csv.encode()), 'text/csv')}
+        malformed_csv = b"this is not,a valid\ncsv file!!!"
+        files = {'file': ('malformed.csv', io.BytesIO(malformed_csv), 'text/csv')}
         
         response = test_client.post('/api/py/v1/etfs', files=files)
         
@@ -207,8 +207,8 @@ class TestETFEndpoint:
         CSV with string values in weight column.
         """
         # Create CSV with non-numeric weight
-        invalid_csv = "name,weight\nA,high\nB,0.2"
-        files = {'file': ('invalid_weight.csv', io.BytesIO(invalid_csv.encode()), 'text/csv')}
+        invalid_csv = b"name,weight\nA,high\nB,0.2"
+        files = {'file': ('invalid_weight.csv', io.BytesIO(invalid_csv), 'text/csv')}
         
         response = test_client.post('/api/py/v1/etfs', files=files)
         
@@ -223,13 +223,45 @@ class TestETFEndpoint:
             "Error should mention numeric/weight issue"
     
     
+    def test_upload_non_utf8_name(self, post_csv):
+        """
+        Test that a name that is not valid UTF-8 is reported as a CSV
+        format error, not as a weight error.
+        """
+        response = post_csv(b"name,weight\nA\xe9,0.5\nB,0.5\n", 'non_utf8.csv')
+        
+        assert response.status_code == 400
+        assert response.json()['detail'].startswith("Invalid CSV format:")
+    
+    
+    def test_upload_too_large(self, post_csv, monkeypatch):
+        """
+        Test that uploads over MAX_UPLOAD_BYTES are rejected with 413 by the
+        endpoint, before they are hashed or parsed.
+        """
+        from api.routers import etf_router
+        
+        body = b"name,weight\nA,0.5\nB,0.5"
+        monkeypatch.setattr(etf_router, 'MAX_UPLOAD_BYTES', len(body) - 1)
+        
+        def fail_parse(*args, **kwargs):
+            raise AssertionError("oversized upload should not reach the parser")
+        monkeypatch.setattr(etf_router.parser, 'parse_csv_file', fail_parse)
+        
+        response = post_csv(body, 'large.csv')
+        
+        assert response.status_code == 413
+        assert "file too large" in response.json()['detail'].lower()
+        assert len(etf_router._response_cache) == 0
+    
+    
     def test_upload_empty_file(self, test_client):
         """
         Test error handling for empty file upload.
         """
         # Create empty file
-        empty_csv = ""
-        files = {'file': ('empty.csv', io.BytesIO(empty_csv.encode()), 'text/csv')}
+        empty_csv = b""
+        files = {'file': ('empty.csv', io.BytesIO(empty_csv), 'text/csv')}
         
         response = test_client.post('/api/py/v1/etfs', files=files)
         
@@ -282,12 +314,12 @@ class TestHealthEndpoint:
         """
         Test that health check reports data as loaded.
         
-        Since we use mock_data_loader, data should be loaded.
+        The router loads the price data when the app is imported.
         """
         response = test_client.get('/api/py/v1/health')
         data = response.json()
         
-        # Data should be loaded (from our mock)
+        # Data should be loaded
         assert data['data_loaded'] is True, \
             "Health check should report data as loaded"
 
@@ -315,6 +347,26 @@ class TestRootEndpoint:
         assert 'versions' in data, "Root should list available versions"
 
 
+class TestLifespan:
+    """Test application startup configuration."""
+    
+    def test_threadpool_size_raised_on_startup(self):
+        """
+        Test that startup sets the worker threadpool to THREADPOOL_TOKENS.
+        
+        The lifespan hook only runs when TestClient is used as a context manager.
+        """
+        from anyio import to_thread
+        from api.index import app
+        from api.utils.config import THREADPOOL_TOKENS
+        
+        async def thread_limit():
+            return to_thread.current_default_thread_limiter().total_tokens
+        
+        with TestClient(app) as client:
+            assert client.portal.call(thread_limit) == THREADPOOL_TOKENS
+
+
 class TestCORSHeaders:
     """Test CORS (Cross-Origin Resource Sharing) configuration."""
     
@@ -333,6 +385,65 @@ class TestCORSHeaders:
         assert response.status_code == 200, "Request should succeed"
 
 
+class TestCompression:
+    """Test gzip compression of responses."""
+    
+    def test_large_response_is_gzipped(self, test_client, test_etf_valid_csv):
+        """
+        Test that the ETF analysis response is gzip-compressed when the
+        client accepts it, while small responses are sent as-is.
+        """
+        with open(test_etf_valid_csv, 'rb') as f:
+            files = {'file': ('etf.csv', f, 'text/csv')}
+            response = test_client.post(
+                '/api/py/v1/etfs', files=files, headers={'Accept-Encoding': 'gzip'}
+            )
+        
+        assert response.status_code == 200
+        assert response.headers.get('content-encoding') == 'gzip'
+        assert 'time_series' in response.json()
+        
+        # Responses under minimum_size are not compressed
+        health_response = test_client.get('/api/py/v1/health', headers={'Accept-Encoding': 'gzip'})
+        assert 'content-encoding' not in health_response.headers
+
+
+class TestResponseCache:
+    """Test caching of analysis responses by upload content."""
+    
+    def test_identical_upload_served_from_cache(self, test_client, test_etf_valid_csv, monkeypatch):
+        """
+        Test that re-uploading the same file returns the cached response
+        without recomputing, and that reloading prices invalidates it.
+        """
+        from api.routers import etf_router
+        
+        content = test_etf_valid_csv.read_bytes()
+        files = {'file': ('etf.csv', content, 'text/csv')}
+        
+        calls = []
+        compute = etf_router._compute_analysis
+        monkeypatch.setattr(
+            etf_router, '_compute_analysis', lambda c: calls.append(c) or compute(c)
+        )
+        
+        first = test_client.post('/api/py/v1/etfs', files=files)
+        assert first.status_code == 200
+        assert len(calls) == 1
+        
+        # Same bytes under a different filename are served from the cache
+        second = test_client.post('/api/py/v1/etfs', files={'file': ('copy.csv', content, 'text/csv')})
+        assert second.status_code == 200
+        assert second.json() == first.json()
+        assert len(calls) == 1, "Cached upload should not be recomputed"
+        
+        # A new price data version misses the cache
+        monkeypatch.setattr(etf_router.data_loader, '_data_version', -1)
+        third = test_client.post('/api/py/v1/etfs', files=files)
+        assert third.status_code == 200
+        assert len(calls) == 2
+
+
 class TestEndToEndWorkflow:
     """Test complete end-to-end workflows."""
     
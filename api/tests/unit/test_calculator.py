@@ -4,7 +4,35 @@ Unit Tests for ETFCalculator Service
 Tests the ETF price calculation logic, latest price retrieval, and top holdings analysis.
 """
 
+import numpy as np
 import pandas as pd
+import pytest
+
+from api.services import ETFRequestCtx
+from api.services import _kernels
+
+
+# Expected keys and types of each get_latest_prices / get_top_holdings entry
+_LATEST_PRICE_FIELDS = {'symbol': str, 'weight': (int, float), 'latest_price': (int, float)}
+_HOLDING_FIELDS = {**_LATEST_PRICE_FIELDS, 'holding_value': (int, float)}
+
+
+def _assert_entries_match(entries, fields):
+    """Assert every entry has all the given keys with values of the given types."""
+    for entry in entries:
+        missing = fields.keys() - entry.keys()
+        assert not missing, f"Entry {entry} is missing {missing}"
+        assert all(isinstance(entry[key], kind) for key, kind in fields.items()), \
+            f"Entry {entry} has a value of the wrong type"
+
+
+@pytest.fixture(scope="module")
+def etf_prices(mock_calculator, sample_constituents):
+    """
+    ETF prices for the sample constituents, computed once for the module.
+    Shared between tests, so it must not be modified.
+    """
+    return mock_calculator.calculate_etf_prices(sample_constituents)
 
 
 class TestETFCalculator:
@@ -22,7 +50,7 @@ class TestETFCalculator:
         assert hasattr(mock_calculator, 'data_loader'), "Calculator should have data_loader"
     
     
-    def test_calculate_etf_prices_returns_dataframe(self, mock_calculator, sample_constituents):
+    def test_calculate_etf_prices_returns_dataframe(self, etf_prices):
         """
         Test that calculate_etf_prices returns a DataFrame.
         
@@ -31,7 +59,7 @@ class TestETFCalculator:
         - Calculates: ETF Price = Σ(weight × stock_price) for each date
         - Returns historical ETF prices
         """
-        result = mock_calculator.calculate_etf_prices(sample_constituents)
+        result = etf_prices
         
         # Check return type
         assert isinstance(result, pd.DataFrame), "Should return a DataFrame"
@@ -44,7 +72,20 @@ class TestETFCalculator:
         assert len(result) > 0, "Result should not be empty"
     
     
-    def test_calculate_etf_prices_correct_calculation(self, mock_calculator):
+    @pytest.fixture(scope="class")
+    def simple_etf_prices(self, mock_calculator):
+        """ETF prices for A=0.5, B=0.3, C=0.2, computed once for the class."""
+        # Use simple constituents for easy verification
+        constituents = [
+            {'name': 'A', 'weight': 0.5},
+            {'name': 'B', 'weight': 0.3},
+            {'name': 'C', 'weight': 0.2}
+        ]
+        return mock_calculator.calculate_etf_prices(constituents)
+    
+    
+    @pytest.mark.parametrize("idx,expected", [(0, 80.0), (2, 82.0), (4, 84.0)])
+    def test_calculate_etf_prices_correct_calculation(self, simple_etf_prices, idx, expected):
         """
         Test that ETF price calculation is mathematically correct.
         
@@ -53,29 +94,17 @@ class TestETFCalculator:
         - Prices: A=100, B=50, C=75
         - Weights: A=0.5, B=0.3, C=0.2
         - Expected ETF Price = 100*0.5 + 50*0.3 + 75*0.2 = 50 + 15 + 15 = 80
-        """
-        # Use simple constituents for easy verification
-        constituents = [
-            {'name': 'A', 'weight': 0.5},
-            {'name': 'B', 'weight': 0.3},
-            {'name': 'C', 'weight': 0.2}
-        ]
-        
-        result = mock_calculator.calculate_etf_prices(constituents)
         
-        # Get first date's price
-        first_price = result['etf_price'].iloc[0]
-        
-        # Manual calculation for 2024-01-01:
-        # A=100, B=50, C=75 (from test_prices.csv)
-        expected = 100 * 0.5 + 50 * 0.3 + 75 * 0.2
+        Every price rises by 1 per day, so the ETF price rises by 1 too.
+        """
+        price = simple_etf_prices['etf_price'].iloc[idx]
         
         # Compare with small tolerance for floating point arithmetic
-        assert abs(first_price - expected) < 0.01, \
-            f"Expected {expected}, got {first_price}"
+        assert abs(price - expected) < 0.01, \
+            f"Expected {expected}, got {price}"
     
     
-    def test_calculate_etf_prices_all_dates(self, mock_calculator, sample_constituents, test_prices_df):
+    def test_calculate_etf_prices_all_dates(self, etf_prices, test_prices_df):
         """
         Test that ETF prices are calculated for all dates in the dataset.
         
@@ -83,18 +112,14 @@ class TestETFCalculator:
         - No dates are skipped
         - Date count matches input data
         """
-        result = mock_calculator.calculate_etf_prices(sample_constituents)
+        result = etf_prices
         
         # Should have same number of dates as input data
         assert len(result) == len(test_prices_df), \
             "ETF prices should be calculated for all dates"
         
         # Dates should match
-        pd.testing.assert_series_equal(
-            result['DATE'].reset_index(drop=True),
-            test_prices_df['DATE'].reset_index(drop=True),
-            check_names=False
-        )
+        assert np.array_equal(result['DATE'].to_numpy(), test_prices_df['DATE'].to_numpy())
     
     
     def test_calculate_etf_prices_with_unknown_symbol(self, mock_calculator, sample_constituents_with_unknown):
@@ -135,18 +160,58 @@ class TestETFCalculator:
         # Should not crash and should return valid numbers
         assert len(result_half) > 0
         assert result_half['etf_price'].iloc[0] > 0
+    
+    
+    def test_calculate_etf_series_matches_dataframe(self, mock_calculator, mock_data_loader, sample_constituents):
+        """
+        Test that calculate_etf_series returns the same data as
+        calculate_etf_prices, with dates shared from the DataLoader.
+        """
+        dates, etf_prices = mock_calculator.calculate_etf_series(sample_constituents)
+        result = mock_calculator.calculate_etf_prices(sample_constituents)
+        
+        assert dates is mock_data_loader.get_dates(), "Dates should not be copied"
+        np.testing.assert_array_equal(dates, result['DATE'].to_numpy())
+        np.testing.assert_array_equal(etf_prices, result['etf_price'].to_numpy())
+    
+    
+    def test_calculate_etf_prices_float32_precision(self, etf_prices, sample_constituents, test_prices_df):
+        """
+        Test that the float32 price matrix stays within 1e-4 of a float64 calculation.
+        """
+        result = etf_prices
+        
+        expected = sum(
+            test_prices_df[c['name']].to_numpy(dtype=np.float64) * c['weight']
+            for c in sample_constituents
+        )
+        
+        assert result['etf_price'].dtype == np.float64
+        assert np.max(np.abs(result['etf_price'].to_numpy() - expected)) < 1e-4
 
 
 class TestGetLatestPrices:
     """Test suite for the get_latest_prices method."""
     
-    def test_get_latest_prices_returns_list(self, mock_calculator, sample_constituents):
+    @pytest.fixture(scope="class")
+    def latest_prices(self, mock_calculator, sample_constituents):
+        """Latest prices for the sample constituents, computed once for the class."""
+        return mock_calculator.get_latest_prices(sample_constituents)
+    
+    
+    @pytest.fixture
+    def latest_prices_for(self, request, mock_calculator):
+        """Latest prices for the constituents given by indirect parametrization."""
+        return mock_calculator.get_latest_prices(request.param)
+    
+    
+    def test_get_latest_prices_returns_list(self, latest_prices):
         """
         Test that get_latest_prices returns a list.
         
         This method gets the most recent price for each constituent.
         """
-        result = mock_calculator.get_latest_prices(sample_constituents)
+        result = latest_prices
         
         # Check type
         assert isinstance(result, list), "Should return a list"
@@ -155,7 +220,7 @@ class TestGetLatestPrices:
         assert len(result) > 0, "Should not be empty"
     
     
-    def test_get_latest_prices_correct_format(self, mock_calculator, sample_constituents):
+    def test_get_latest_prices_correct_format(self, latest_prices):
         """
         Test that each entry in the result has the correct format.
         
@@ -166,21 +231,11 @@ class TestGetLatestPrices:
             'latest_price': 104.0
         }
         """
-        result = mock_calculator.get_latest_prices(sample_constituents)
-        
-        # Check each entry has required keys
-        for entry in result:
-            assert 'symbol' in entry, "Each entry should have 'symbol'"
-            assert 'weight' in entry, "Each entry should have 'weight'"
-            assert 'latest_price' in entry, "Each entry should have 'latest_price'"
-            
-            # Check types
-            assert isinstance(entry['symbol'], str), "Symbol should be string"
-            assert isinstance(entry['weight'], (int, float)), "Weight should be numeric"
-            assert isinstance(entry['latest_price'], (int, float)), "Price should be numeric"
+        # Check each entry has the required keys and types
+        _assert_entries_match(latest_prices, _LATEST_PRICE_FIELDS)
     
     
-    def test_get_latest_prices_uses_last_date(self, mock_calculator, test_prices_df):
+    def test_get_latest_prices_uses_last_date(self, mock_calculator, last_row):
         """
         Test that get_latest_prices uses the LAST date in the dataset.
         
@@ -192,55 +247,66 @@ class TestGetLatestPrices:
         result = mock_calculator.get_latest_prices(constituents)
         
         # Get the latest price for A from our test data
-        expected_price = test_prices_df.iloc[-1]['A']
+        expected_price = last_row['A']
         
         # Should match
         assert result[0]['latest_price'] == expected_price, \
             f"Should use last date's price. Expected {expected_price}, got {result[0]['latest_price']}"
     
     
-    def test_get_latest_prices_all_constituents(self, mock_calculator, sample_constituents):
+    def test_get_latest_prices_all_constituents(self, latest_prices, sample_constituents):
         """
         Test that all constituents are included in the result.
         
         If we request 5 constituents, we should get 5 results.
         """
-        result = mock_calculator.get_latest_prices(sample_constituents)
+        result = latest_prices
         
         # Should return entry for each constituent
         assert len(result) == len(sample_constituents), \
             "Should return price for each constituent"
         
         # Check all symbols are present
-        result_symbols = {entry['symbol'] for entry in result}
+        by_symbol = {entry['symbol']: entry for entry in result}
         expected_symbols = {c['name'] for c in sample_constituents}
-        assert result_symbols == expected_symbols, "All symbols should be present"
+        assert by_symbol.keys() == expected_symbols, "All symbols should be present"
     
     
-    def test_get_latest_prices_unknown_symbol(self, mock_calculator):
+    @pytest.mark.parametrize(
+        "latest_prices_for,expected_unknowns",
+        [
+            ([{'name': 'A', 'weight': 0.5}, {'name': 'UNKNOWN', 'weight': 0.5}], {'UNKNOWN'}),
+            ([{'name': 'X', 'weight': 0.2}, {'name': 'B', 'weight': 0.6}, {'name': 'Y', 'weight': 0.2}], {'X', 'Y'}),
+        ],
+        indirect=["latest_prices_for"],
+        ids=["one_unknown", "two_unknowns"]
+    )
+    def test_get_latest_prices_unknown_symbol(self, latest_prices_for, expected_unknowns):
         """
         Test behavior when a constituent doesn't exist in price data.
         
-        Expected: Should return 0.0 for unknown symbols.
+        Expected: Should return 0.0 for unknown symbols, and a real
+        price for every known one.
         """
-        constituents = [
-            {'name': 'A', 'weight': 0.5},
-            {'name': 'UNKNOWN', 'weight': 0.5}
-        ]
+        by_symbol = {entry['symbol']: entry for entry in latest_prices_for}
         
-        result = mock_calculator.get_latest_prices(constituents)
-        
-        # Find the UNKNOWN entry
-        unknown_entry = next(e for e in result if e['symbol'] == 'UNKNOWN')
-        
-        # Should have price of 0.0
-        assert unknown_entry['latest_price'] == 0.0, \
-            "Unknown symbols should have price 0.0"
+        for symbol in expected_unknowns:
+            assert by_symbol[symbol]['latest_price'] == 0.0, \
+                "Unknown symbols should have price 0.0"
+        for symbol in by_symbol.keys() - expected_unknowns:
+            assert by_symbol[symbol]['latest_price'] > 0, "Known symbols should have a price"
 
 
 class TestGetTopHoldings:
     """Test suite for the get_top_holdings method."""
     
+    @pytest.fixture(scope="class")
+    def all_holdings(self, mock_calculator, sample_constituents):
+        """
+        Every sample holding ranked by value, computed once for the class.
+        """
+        return mock_calculator.get_top_holdings(sample_constituents, top_n=100)
+    
     def test_get_top_holdings_returns_list(self, mock_calculator, sample_constituents):
         """
         Test that get_top_holdings returns a list.
@@ -254,7 +320,7 @@ class TestGetTopHoldings:
         assert len(result) <= 3, "Should return at most 3 holdings"
     
     
-    def test_get_top_holdings_correct_format(self, mock_calculator, sample_constituents):
+    def test_get_top_holdings_correct_format(self, all_holdings):
         """
         Test that each holding has the correct format.
         
@@ -266,55 +332,44 @@ class TestGetTopHoldings:
             'holding_value': 31.2  # 0.3 * 104.0
         }
         """
-        result = mock_calculator.get_top_holdings(sample_constituents, top_n=5)
+        # Check required keys and types
+        _assert_entries_match(all_holdings, _HOLDING_FIELDS)
         
-        for holding in result:
-            # Check required keys
-            assert 'symbol' in holding
-            assert 'weight' in holding
-            assert 'latest_price' in holding
-            assert 'holding_value' in holding
-            
+        for holding in all_holdings:
             # Verify calculation: holding_value = weight × price
             expected_value = holding['weight'] * holding['latest_price']
             assert abs(holding['holding_value'] - expected_value) < 0.01, \
                 "holding_value should equal weight × price"
     
     
-    def test_get_top_holdings_sorted_by_value(self, mock_calculator, sample_constituents):
+    def test_get_top_holdings_sorted_by_value(self, all_holdings):
         """
         Test that holdings are sorted by value in descending order.
         
         Top holdings = largest holding_value first
         """
-        result = mock_calculator.get_top_holdings(sample_constituents, top_n=5)
-        
         # Extract holding values
-        values = [h['holding_value'] for h in result]
+        values = [h['holding_value'] for h in all_holdings]
         
         # Should be in descending order
         assert values == sorted(values, reverse=True), \
             "Holdings should be sorted by value (highest first)"
     
     
-    def test_get_top_holdings_respects_top_n(self, mock_calculator, sample_constituents):
+    @pytest.mark.parametrize("n,expected", [(3, 3), (2, 2), (10, 5)])
+    def test_get_top_holdings_respects_top_n(self, mock_calculator, sample_constituents, all_holdings, n, expected):
         """
         Test that top_n parameter limits the number of results.
         
         If we have 5 constituents but request top 3,
-        we should get exactly 3 results.
+        we should get exactly 3 results; requesting more than
+        available returns all 5. The result is always the head of
+        the full ranking.
         """
-        # Request top 3
-        result = mock_calculator.get_top_holdings(sample_constituents, top_n=3)
-        assert len(result) == 3, "Should return exactly 3 holdings"
+        result = mock_calculator.get_top_holdings(sample_constituents, top_n=n)
         
-        # Request top 2
-        result = mock_calculator.get_top_holdings(sample_constituents, top_n=2)
-        assert len(result) == 2, "Should return exactly 2 holdings"
-        
-        # Request more than available
-        result = mock_calculator.get_top_holdings(sample_constituents, top_n=10)
-        assert len(result) == 5, "Should return all available holdings (5)"
+        assert len(result) == expected, f"Should return exactly {expected} holdings"
+        assert result == all_holdings[:n], "Top N should be the head of the full ranking"
     
     
     def test_get_top_holdings_calculation(self, mock_calculator):
@@ -352,3 +407,155 @@ class TestGetTopHoldings:
         # Should return 5 (or all available if less than 5)
         assert len(result) <= 5, "Default should be top 5"
 
+
+class TestComputeHoldings:
+    """Test suite for the fused compute_holdings method."""
+    
+    def test_compute_holdings_matches_separate_methods(self, mock_calculator, sample_constituents):
+        """
+        Test that compute_holdings returns the same data as calling
+        get_latest_prices and get_top_holdings separately.
+        """
+        table_data, top_holdings = mock_calculator.compute_holdings(sample_constituents, top_n=3)
+        
+        assert table_data == mock_calculator.get_latest_prices(sample_constituents)
+        assert top_holdings == mock_calculator.get_top_holdings(sample_constituents, top_n=3)
+    
+    
+    def test_compute_holdings_ties_keep_input_order(self, mock_calculator):
+        """
+        Test that holdings with equal value keep their original order.
+        
+        Test data (last date): A=104.0, D=29.0
+        - A: 0.25 × 104 = 26.0
+        - D: ~0.8966 × 29 = 26.0 (same value as A)
+        """
+        constituents = [
+            {'name': 'D', 'weight': 26.0 / 29.0},
+            {'name': 'A', 'weight': 0.25},
+            {'name': 'UNKNOWN', 'weight': 0.1}
+        ]
+        
+        table_data, top_holdings = mock_calculator.compute_holdings(constituents, top_n=2)
+        
+        assert [entry['symbol'] for entry in table_data] == ['D', 'A', 'UNKNOWN']
+        assert table_data[2]['latest_price'] == 0.0
+        assert [h['symbol'] for h in top_holdings] == ['D', 'A']
+
+
+class TestETFRequestCtx:
+    """Test suite for the per-request ETFRequestCtx."""
+    
+    def test_from_constituents(self, mock_data_loader, sample_constituents_with_unknown):
+        """
+        Test that the context holds symbols, weights and matrix columns
+        in input order, with -1 for symbols missing from the price data.
+        """
+        ctx = ETFRequestCtx.from_constituents(sample_constituents_with_unknown, mock_data_loader)
+        symbol_idx = mock_data_loader.get_symbol_index()
+        
+        assert ctx.symbols == [c['name'] for c in sample_constituents_with_unknown]
+        assert ctx.weights.tolist() == [c['weight'] for c in sample_constituents_with_unknown]
+        assert ctx.col_indices.tolist() == [symbol_idx.get(s, -1) for s in ctx.symbols]
+        assert -1 in ctx.col_indices.tolist()
+    
+    
+    def test_ctx_compares_and_hashes_by_identity(self, mock_data_loader, sample_constituents):
+        """Test that contexts holding arrays can be compared and hashed without errors."""
+        ctx = ETFRequestCtx.from_constituents(sample_constituents, mock_data_loader)
+        other = ETFRequestCtx.from_constituents(sample_constituents, mock_data_loader)
+        
+        assert ctx == ctx
+        assert ctx != other
+        assert hash(ctx) != hash(other)
+    
+    
+    def test_ctx_and_constituents_give_same_results(self, mock_calculator, mock_data_loader, sample_constituents):
+        """
+        Test that calculator methods return the same data whether given
+        raw constituents or a prebuilt context.
+        """
+        ctx = ETFRequestCtx.from_constituents(sample_constituents, mock_data_loader)
+        
+        pd.testing.assert_frame_equal(
+            mock_calculator.calculate_etf_prices(ctx),
+            mock_calculator.calculate_etf_prices(sample_constituents)
+        )
+        assert mock_calculator.compute_holdings(ctx) == mock_calculator.compute_holdings(sample_constituents)
+
+
+class TestWeightedSumKernel:
+    """Test suite for the compiled weighted-sum kernel."""
+    
+    def test_numba_kernels_available(self):
+        """
+        Test that numba is installed, so the compiled kernels (not only the
+        NumPy fallbacks) are exercised by this suite.
+        """
+        assert _kernels.HAS_NUMBA, "numba is listed in requirements.txt and should be installed"
+    
+    @pytest.mark.parametrize("force_numpy", [False, True])
+    def test_weighted_sum_matches_matmul(self, monkeypatch, force_numpy):
+        """
+        Test that the kernel matches a float64 matmul for a matrix large
+        enough to take the parallel path, with and without numba.
+        """
+        if force_numpy:
+            monkeypatch.setattr(_kernels, 'HAS_NUMBA', False)
+        
+        rng = np.random.default_rng(0)
+        matrix = rng.uniform(1, 100, size=(2000, 50)).astype(np.float32)
+        weights = rng.dirichlet(np.ones(50)).astype(np.float32)
+        assert matrix.size >= _kernels.PARALLEL_MIN_ELEMENTS
+        
+        result = _kernels.weighted_sum(matrix, weights)
+        expected = matrix.astype(np.float64) @ weights.astype(np.float64)
+        
+        assert result.dtype == np.float64
+        assert np.max(np.abs(result - expected)) < 1e-4
+    
+    
+    def test_numpy_path_does_not_copy_matrix(self, monkeypatch):
+        """
+        Test that the NumPy fallback upcasts in row blocks instead of
+        making a float64 copy of the whole matrix.
+        """
+        import tracemalloc
+        monkeypatch.setattr(_kernels, 'HAS_NUMBA', False)
+        
+        rng = np.random.default_rng(2)
+        matrix = rng.uniform(1, 100, size=(4000, 500)).astype(np.float32)
+        weights = rng.dirichlet(np.ones(500)).astype(np.float32)
+        
+        tracemalloc.start()
+        try:
+            result = _kernels.weighted_sum(matrix, weights)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        
+        np.testing.assert_allclose(result, matrix.astype(np.float64) @ weights.astype(np.float64), rtol=1e-12)
+        # A full float64 copy would be 2x the float32 matrix
+        assert peak < matrix.nbytes / 4, f"Peak {peak} bytes suggests a full matrix copy"
+    
+    
+    @pytest.mark.parametrize("force_numpy", [False, True])
+    def test_weighted_sum_keeps_nan_and_float64_precision(self, monkeypatch, force_numpy):
+        """
+        Test that missing prices (NaN) propagate to their rows and that
+        both paths compute in float64, on either side of the size threshold.
+        """
+        if force_numpy:
+            monkeypatch.setattr(_kernels, 'HAS_NUMBA', False)
+        
+        rng = np.random.default_rng(1)
+        for rows in (10, 2000):  # below and above PARALLEL_MIN_ELEMENTS
+            matrix = rng.uniform(1, 100, size=(rows, 50)).astype(np.float32)
+            matrix[3, 7] = np.nan
+            weights = rng.dirichlet(np.ones(50)).astype(np.float32)
+            
+            result = _kernels.weighted_sum(matrix, weights)
+            expected = matrix.astype(np.float64) @ weights.astype(np.float64)
+            
+            assert np.isnan(result[3])
+            np.testing.assert_allclose(result, expected, rtol=1e-12)
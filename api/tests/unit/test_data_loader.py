@@ -4,8 +4,37 @@ Unit Tests for DataLoader Service
 Tests the data loading functionality, singleton pattern, and data access methods.
 """
 
+import os
+import shutil
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pytest
 from api.services import DataLoader
+from api.services import data_loader as data_loader_module
+
+
+def _frames_equal(a, b):
+    """
+    Cheap equality check for DataFrames with a known schema.
+    
+    Compares column names and dtypes, then each column's NumPy array;
+    use pd.testing.assert_frame_equal where index or metadata matter.
+    """
+    return (
+        list(a.columns) == list(b.columns)
+        and a.dtypes.equals(b.dtypes)
+        and all(np.array_equal(a[col].to_numpy(), b[col].to_numpy()) for col in a.columns)
+    )
+
+
+@pytest.fixture(scope="module")
+def loaded_prices(_test_data_loader):
+    """
+    The test loader's prices, copied once for the read-only schema tests
+    in this module. Tests that modify the data call get_prices() themselves.
+    """
+    return _test_data_loader.get_prices()
 
 
 class TestDataLoader:
@@ -34,10 +63,10 @@ class TestDataLoader:
         df2 = loader2.get_prices()
         
         # Compare DataFrames
-        pd.testing.assert_frame_equal(df1, df2)
+        assert _frames_equal(df1, df2)
     
     
-    def test_get_prices_returns_dataframe(self, mock_data_loader):
+    def test_get_prices_returns_dataframe(self, loaded_prices):
         """
         Test that get_prices() returns a pandas DataFrame.
         
@@ -45,7 +74,7 @@ class TestDataLoader:
         - Method returns the correct data type
         - DataFrame is not None or empty
         """
-        prices_df = mock_data_loader.get_prices()
+        prices_df = loaded_prices
         
         # Check type
         assert isinstance(prices_df, pd.DataFrame), "get_prices should return a DataFrame"
@@ -70,7 +99,7 @@ class TestDataLoader:
         df2 = mock_data_loader.get_prices()
         
         # They should have the same values
-        pd.testing.assert_frame_equal(df1, df2)
+        assert _frames_equal(df1, df2)
         
         # But be different objects in memory
         assert df1 is not df2, "get_prices should return a copy, not the original"
@@ -85,7 +114,7 @@ class TestDataLoader:
         assert df3['A'].iloc[0] != 999, "Modifying returned DataFrame should not affect cached data"
     
     
-    def test_prices_have_date_column(self, mock_data_loader):
+    def test_prices_have_date_column(self, loaded_prices):
         """
         Test that the prices DataFrame contains a DATE column.
         
@@ -93,7 +122,7 @@ class TestDataLoader:
         - Our application depends on the DATE column for time series
         - If it's missing, the entire app breaks
         """
-        prices_df = mock_data_loader.get_prices()
+        prices_df = loaded_prices
         
         # Check DATE column exists
         assert 'DATE' in prices_df.columns, "DataFrame must have a DATE column"
@@ -103,7 +132,7 @@ class TestDataLoader:
             "DATE column should be datetime type"
     
     
-    def test_prices_are_sorted_by_date(self, mock_data_loader):
+    def test_prices_are_sorted_by_date(self, loaded_prices):
         """
         Test that prices are sorted chronologically by date.
         
@@ -111,7 +140,7 @@ class TestDataLoader:
         - Time series analysis requires chronological order
         - Latest price calculations depend on data being in order
         """
-        prices_df = mock_data_loader.get_prices()
+        prices_df = loaded_prices
         
         # Check that dates are in ascending order
         dates = prices_df['DATE']
@@ -144,7 +173,7 @@ class TestDataLoader:
         assert len(symbols) == 5, "Test data should have exactly 5 symbols"
     
     
-    def test_prices_have_correct_columns(self, mock_data_loader, test_prices_df):
+    def test_prices_have_correct_columns(self, loaded_prices, test_prices_df, price_columns):
         """
         Test that loaded prices match the expected column structure.
         
@@ -153,10 +182,10 @@ class TestDataLoader:
         - Column count
         - Data types
         """
-        prices_df = mock_data_loader.get_prices()
+        prices_df = loaded_prices
         
         # Check column names match
-        assert list(prices_df.columns) == list(test_prices_df.columns), \
+        assert list(prices_df.columns) == price_columns, \
             "Loaded columns should match test data columns"
         
         # Check we have the right number of rows
@@ -164,7 +193,7 @@ class TestDataLoader:
             "Loaded data should have same number of rows as test data"
     
     
-    def test_prices_contain_numeric_values(self, mock_data_loader):
+    def test_prices_contain_numeric_values(self, loaded_prices):
         """
         Test that all stock price columns contain numeric values.
         
@@ -172,19 +201,62 @@ class TestDataLoader:
         - Calculations will fail if prices are strings or other types
         - Data validation is crucial for reliability
         """
-        prices_df = mock_data_loader.get_prices()
+        prices_df = loaded_prices
         
         # Get all columns except DATE
-        price_columns = [col for col in prices_df.columns if col != 'DATE']
-        
-        # Check each column is numeric
-        for col in price_columns:
-            assert pd.api.types.is_numeric_dtype(prices_df[col]), \
-                f"Column {col} should contain numeric values"
-            
-            # Check for no NaN values in test data
-            assert not prices_df[col].isna().any(), \
-                f"Column {col} should not contain NaN values"
+        non_date = prices_df.drop(columns=['DATE'])
+        
+        # Check every column is numeric
+        non_numeric = non_date.columns.difference(non_date.select_dtypes(include='number').columns)
+        assert non_numeric.empty, f"Columns {list(non_numeric)} should contain numeric values"
+        
+        # Check for no NaN values in test data
+        assert not non_date.isna().to_numpy().any(), "Prices should not contain NaN values"
+
+    
+    def test_price_matrix_matches_prices(self, mock_data_loader, test_prices_df):
+        """
+        Test that the cached NumPy price matrix mirrors the prices DataFrame.
+        
+        Checks:
+        - One row per date, one column per symbol
+        - Column order follows get_available_symbols()
+        - The matrix is float32 and read-only so requests cannot corrupt the shared cache
+        - The latest row keeps full float64 precision
+        """
+        matrix = mock_data_loader.get_matrix()
+        symbols = mock_data_loader.get_available_symbols()
+        
+        assert matrix.shape == (len(test_prices_df), len(symbols))
+        assert matrix.dtype == np.float32
+        np.testing.assert_array_equal(matrix, test_prices_df[symbols].to_numpy(dtype=np.float32))
+        assert not matrix.flags.writeable, "Price matrix should be read-only"
+        
+        latest_row = mock_data_loader.get_latest_row()
+        np.testing.assert_array_equal(latest_row, test_prices_df[symbols].iloc[-1].to_numpy(dtype=np.float64))
+        assert not latest_row.flags.writeable, "Latest row should be read-only"
+    
+    
+    def test_symbol_index_and_dates(self, mock_data_loader, test_prices_df):
+        """
+        Test the symbol → column map and the cached date array.
+        """
+        symbol_idx = mock_data_loader.get_symbol_index()
+        symbols = mock_data_loader.get_available_symbols()
+        
+        # Every symbol maps to its own column
+        assert [symbols[i] for i in symbol_idx.values()] == list(symbol_idx.keys())
+        assert 'DATE' not in symbol_idx
+        
+        # Dates are aligned with the matrix rows
+        dates = mock_data_loader.get_dates()
+        np.testing.assert_array_equal(dates, test_prices_df['DATE'].to_numpy())
+        assert mock_data_loader.get_date_strings() == test_prices_df['DATE'].dt.strftime('%Y-%m-%d').tolist()
+        
+        # Symbol set matches the symbol list and is cached between calls
+        symbol_set = mock_data_loader.get_symbol_set()
+        assert symbol_set == frozenset(symbols)
+        assert mock_data_loader.get_symbol_set() is symbol_set
 
 
 # =============================================================================
@@ -204,10 +276,92 @@ class TestDataLoaderEdgeCases:
         # Reset the singleton
         DataLoader._instance = None
         DataLoader._prices_df = None
+        DataLoader._symbol_set = None
         
         # Should be able to create a new instance
         # (This will fail in normal code because it tries to load the real file,
         # but that's expected - this test verifies the singleton reset works)
         assert DataLoader._instance is None, "Singleton should be reset"
         assert DataLoader._prices_df is None, "Cached data should be reset"
+        assert DataLoader._symbol_set is None, "Cached symbol set should be reset"
+
 
+
+class TestParquetCache:
+    """Test the Parquet cache written next to prices.csv."""
+    
+    @pytest.fixture
+    def data_dir(self, tmp_path, monkeypatch, test_prices_csv):
+        """
+        Points DataLoader at a temporary data/ directory containing a copy of
+        the test prices, with a fresh singleton that is restored afterwards.
+        """
+        shutil.copy(test_prices_csv, tmp_path / "prices.csv")
+        monkeypatch.setattr(data_loader_module, 'DATA_DIR', tmp_path)
+        monkeypatch.setattr(DataLoader, '_instance', None)
+        monkeypatch.setattr(DataLoader, '_prices_df', None)
+        return tmp_path
+    
+    def test_parquet_cache_used_on_next_load(self, data_dir, monkeypatch):
+        """
+        Test that the first load writes prices.parquet and the next load
+        reads it instead of parsing the CSV again.
+        """
+        from_csv = DataLoader().get_prices()
+        assert (data_dir / "prices.parquet").exists(), "Parquet cache should be written"
+        
+        # Any further CSV parse would now fail
+        def fail_read_csv(*args, **kwargs):
+            raise AssertionError("prices.csv should not be parsed again")
+        monkeypatch.setattr(data_loader_module.pd, 'read_csv', fail_read_csv)
+        
+        DataLoader._instance = None
+        from_parquet = DataLoader().get_prices()
+        
+        pd.testing.assert_frame_equal(from_csv, from_parquet)
+    
+    def test_corrupt_parquet_cache_falls_back_to_csv(self, data_dir):
+        """
+        Test that an unreadable (but fresh) Parquet cache is ignored, the CSV
+        is parsed instead, and the cache is rewritten.
+        """
+        from_csv = DataLoader().get_prices()
+        parquet_path = data_dir / "prices.parquet"
+        parquet_path.write_bytes(b'PAR1garbage')
+        
+        DataLoader._instance = None
+        DataLoader._prices_df = None
+        pd.testing.assert_frame_equal(DataLoader().get_prices(), from_csv)
+        
+        # The rewritten cache is valid and no temporary files are left behind
+        pd.testing.assert_frame_equal(pd.read_parquet(parquet_path, dtype_backend='pyarrow'), from_csv)
+        assert sorted(p.name for p in data_dir.iterdir()) == ["prices.csv", "prices.parquet"]
+    
+    def test_loaded_prices_are_arrow_backed(self, data_dir):
+        """
+        Test that prices read from the CSV are Arrow-backed, with every
+        price column as float64, while the cached arrays stay NumPy.
+        """
+        loader = DataLoader()
+        dtypes = loader.get_prices().dtypes
+        
+        assert dtypes['DATE'] == pd.ArrowDtype(pa.timestamp('ns'))
+        assert (dtypes.drop('DATE') == pd.ArrowDtype(pa.float64())).all()
+        assert loader.get_dates().dtype == np.dtype('datetime64[ns]')
+        assert loader.get_matrix().dtype == np.float32
+    
+    def test_stale_parquet_cache_is_rebuilt(self, data_dir):
+        """
+        Test that a Parquet cache older than prices.csv is ignored and rewritten.
+        """
+        DataLoader()
+        parquet_path = data_dir / "prices.parquet"
+        
+        # Make the cache older than the CSV
+        stale_mtime = (data_dir / "prices.csv").stat().st_mtime - 10
+        os.utime(parquet_path, (stale_mtime, stale_mtime))
+        
+        DataLoader._instance = None
+        DataLoader()
+        
+        assert parquet_path.stat().st_mtime > stale_mtime, "Stale cache should be rewritten"
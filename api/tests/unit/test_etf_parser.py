@@ -3,16 +3,28 @@ Unit tests for ETFDataParser service.
 Tests CSV parsing and format validation.
 """
 
+import math
+import numpy as np
 import pytest
-from api.services.etf_parser import ETFDataParser
+from api.services import etf_parser
+from api.services.etf_parser import Constituents, ETFDataParser, get_parser
 
 
+@pytest.fixture(autouse=True, params=['pyarrow', 'pandas'])
+def engine(request, monkeypatch):
+    """Run every test with the pyarrow reader and with the pandas fallback."""
+    if request.param == 'pyarrow':
+        pytest.importorskip("pyarrow")
+    else:
+        monkeypatch.setattr(etf_parser, 'pacsv', None)
+    return request.param
+
 class TestETFDataParser:
     """Test suite for ETFDataParser class."""
     
     def test_parse_valid_csv(self):
         """Test parsing a valid CSV file."""
-        parser = ETFDataParser()
+        parser = get_parser()
         csv_content = b"name,weight\nA,0.5\nB,0.3\nC,0.2"
         
         result = parser.parse_csv_file(csv_content, "test.csv")
@@ -24,7 +36,7 @@ class TestETFDataParser:
     
     def test_parse_csv_with_extra_columns(self):
         """Test that parser only extracts name and weight columns."""
-        parser = ETFDataParser()
+        parser = get_parser()
         csv_content = b"name,weight,sector,country\nA,0.5,Tech,US\nB,0.5,Finance,UK"
         
         result = parser.parse_csv_file(csv_content, "test.csv")
@@ -40,7 +52,7 @@ class TestCSVFormatValidation:
     
     def test_invalid_csv_format(self):
         """Test handling of completely malformed CSV."""
-        parser = ETFDataParser()
+        parser = get_parser()
         # This will be parsed by pandas but missing required columns
         invalid_content = b"not a valid csv\n<<<>>>"
         
@@ -50,9 +62,52 @@ class TestCSVFormatValidation:
         # Will fail on missing columns check
         assert "must contain" in str(exc_info.value).lower()
     
+    def test_non_utf8_name_is_format_error(self):
+        """Test that a name that is not valid UTF-8 is a format error, not a weight error."""
+        parser = get_parser()
+        csv_content = b"name,weight\nA\xe9,0.5\nB,0.5\n"
+        
+        with pytest.raises(ValueError) as exc_info:
+            parser.parse_csv_file(csv_content, "test.csv")
+        
+        error_msg = str(exc_info.value)
+        assert error_msg.startswith("Invalid CSV format:")
+        assert "numeric" not in error_msg
+    
+    def test_non_utf8_name_with_invalid_weight(self):
+        """
+        Test that a name that is not valid UTF-8 is still a format error when
+        the weight column fails first and is re-read as text.
+        """
+        parser = get_parser()
+        csv_content = b"weight,name\nabc,A\xe9\n"
+        
+        with pytest.raises(ValueError, match="^Invalid CSV format:"):
+            parser.parse_csv_file(csv_content, "test.csv")
+    
+    @pytest.mark.parametrize("csv_content, got", [
+        (b"name,weight\nA,0.5\nB\n", 1),              # Short row
+        (b"name,weight\nA,0.5\nB,0.5,extra\n", 3),    # Long row
+        (b"name,weight\nA,0.5,extra\nB,0.5\n", 3),    # Long first row
+    ])
+    def test_ragged_rows_are_rejected(self, csv_content, got):
+        """Test that rows with more or fewer fields than the header are format errors."""
+        parser = get_parser()
+        
+        with pytest.raises(ValueError, match=f"^Invalid CSV format: .*Expected 2 columns, got {got}"):
+            parser.parse_csv_file(csv_content, "test.csv")
+    
+    def test_blank_lines_are_skipped(self):
+        """Test that blank lines are not treated as ragged rows."""
+        parser = get_parser()
+        
+        result = parser.parse_csv_file(b"name,weight\nA,0.5\n\nB,0.5\n\n", "test.csv")
+        
+        assert result == [{'name': 'A', 'weight': 0.5}, {'name': 'B', 'weight': 0.5}]
+    
     def test_missing_name_column(self):
         """Test rejection when 'name' column is missing."""
-        parser = ETFDataParser()
+        parser = get_parser()
         csv_content = b"symbol,weight\nA,0.5"
         
         with pytest.raises(ValueError) as exc_info:
@@ -66,7 +121,7 @@ class TestCSVFormatValidation:
     
     def test_missing_weight_column(self):
         """Test rejection when 'weight' column is missing."""
-        parser = ETFDataParser()
+        parser = get_parser()
         csv_content = b"name,value\nA,0.5"
         
         with pytest.raises(ValueError) as exc_info:
@@ -76,7 +131,7 @@ class TestCSVFormatValidation:
     
     def test_missing_both_columns(self):
         """Test rejection when both required columns are missing."""
-        parser = ETFDataParser()
+        parser = get_parser()
         csv_content = b"symbol,value\nA,0.5"
         
         with pytest.raises(ValueError) as exc_info:
@@ -86,7 +141,7 @@ class TestCSVFormatValidation:
     
     def test_empty_csv(self):
         """Test rejection of empty CSV (no data rows)."""
-        parser = ETFDataParser()
+        parser = get_parser()
         csv_content = b"name,weight\n"
         
         with pytest.raises(ValueError) as exc_info:
@@ -96,7 +151,7 @@ class TestCSVFormatValidation:
     
     def test_duplicate_column_names(self):
         """Test rejection of CSV with duplicate column names."""
-        parser = ETFDataParser()
+        parser = get_parser()
         # CSV with duplicate 'name' column
         csv_content = b"name,weight,name\nA,0.3,X\nB,0.4,Y\nC,0.3,Z"
         
@@ -109,7 +164,7 @@ class TestCSVFormatValidation:
     
     def test_multiple_duplicate_columns(self):
         """Test rejection of CSV with multiple duplicate columns."""
-        parser = ETFDataParser()
+        parser = get_parser()
         # CSV with duplicate 'name' and 'weight' columns
         csv_content = b"name,weight,name,weight\nA,0.5,X,0.5"
         
@@ -127,7 +182,7 @@ class TestWeightTypeConversion:
     
     def test_integer_weights(self):
         """Test that integer weights are converted to float."""
-        parser = ETFDataParser()
+        parser = get_parser()
         csv_content = b"name,weight\nA,1\nB,0"
         
         result = parser.parse_csv_file(csv_content, "test.csv")
@@ -139,7 +194,7 @@ class TestWeightTypeConversion:
     
     def test_string_numeric_weights(self):
         """Test that numeric strings are converted to float."""
-        parser = ETFDataParser()
+        parser = get_parser()
         csv_content = b"name,weight\nA,0.5\nB,0.3"
         
         result = parser.parse_csv_file(csv_content, "test.csv")
@@ -149,7 +204,7 @@ class TestWeightTypeConversion:
     
     def test_invalid_weight_string(self):
         """Test rejection of non-numeric weight values."""
-        parser = ETFDataParser()
+        parser = get_parser()
         csv_content = b"name,weight\nA,invalid"
         
         with pytest.raises(ValueError) as exc_info:
@@ -157,13 +212,22 @@ class TestWeightTypeConversion:
         
         assert "must be numeric" in str(exc_info.value)
     
+    @pytest.mark.parametrize("first, second", [("true", "false"), ("TRUE", "FALSE"), ("True", "0.5")])
+    def test_boolean_weights_are_rejected(self, first, second):
+        """Test that true/false are not read as 1.0/0.0, even in an all-boolean column."""
+        parser = get_parser()
+        csv_content = f"name,weight\nA,{first}\nB,{second}".encode()
+        
+        with pytest.raises(ValueError, match=f"Weight for 'A' must be numeric, got '{first}'"):
+            parser.parse_csv_file(csv_content, "test.csv")
+    
     def test_invalid_weight_empty(self):
         """Test rejection of empty weight values."""
-        parser = ETFDataParser()
+        parser = get_parser()
         csv_content = b"name,weight\nA,"
         
-        # pandas converts empty string to NaN, which we accept as 0
-        # This actually parses successfully, business validation will catch it later
+        # Empty weights are parsed as NaN; ETFValidator.validate_weight_ranges
+        # rejects them as business-rule errors
         result = parser.parse_csv_file(csv_content, "test.csv")
         
         # Empty weight becomes NaN, which float() converts to nan
@@ -172,13 +236,22 @@ class TestWeightTypeConversion:
     
     def test_multiple_invalid_weights(self):
         """Test that first invalid weight is reported."""
-        parser = ETFDataParser()
+        parser = get_parser()
         csv_content = b"name,weight\nA,invalid1\nB,invalid2"
         
         with pytest.raises(ValueError) as exc_info:
             parser.parse_csv_file(csv_content, "test.csv")
         
         assert "must be numeric" in str(exc_info.value)
+        assert "Weight for 'A'" in str(exc_info.value)
+    
+    def test_invalid_weight_names_its_row(self):
+        """Test that missing cells are skipped when locating the invalid weight."""
+        parser = get_parser()
+        csv_content = b"name,weight\nA,\nB,NA\nC,high\nD,0.5"
+        
+        with pytest.raises(ValueError, match="Weight for 'C' must be numeric, got 'high'"):
+            parser.parse_csv_file(csv_content, "test.csv")
 
 
 class TestEdgeCases:
@@ -186,7 +259,7 @@ class TestEdgeCases:
     
     def test_single_constituent(self):
         """Test parsing CSV with single constituent."""
-        parser = ETFDataParser()
+        parser = get_parser()
         csv_content = b"name,weight\nA,1.0"
         
         result = parser.parse_csv_file(csv_content, "test.csv")
@@ -196,7 +269,7 @@ class TestEdgeCases:
     
     def test_many_constituents(self):
         """Test parsing CSV with many constituents."""
-        parser = ETFDataParser()
+        parser = get_parser()
         # Create CSV with 50 constituents
         csv_lines = ["name,weight"]
         for i in range(50):
@@ -209,7 +282,7 @@ class TestEdgeCases:
     
     def test_zero_weight(self):
         """Test that zero weight is accepted (format validation only)."""
-        parser = ETFDataParser()
+        parser = get_parser()
         csv_content = b"name,weight\nA,0\nB,1.0"
         
         result = parser.parse_csv_file(csv_content, "test.csv")
@@ -219,7 +292,7 @@ class TestEdgeCases:
     
     def test_negative_weight(self):
         """Test that negative weight is accepted by parser (business validation later)."""
-        parser = ETFDataParser()
+        parser = get_parser()
         csv_content = b"name,weight\nA,-0.5\nB,1.5"
         
         # Parser only validates format, not business rules
@@ -230,7 +303,7 @@ class TestEdgeCases:
     
     def test_whitespace_in_names(self):
         """Test handling of whitespace in symbol names."""
-        parser = ETFDataParser()
+        parser = get_parser()
         csv_content = b"name,weight\n A ,0.5\n B ,0.5"
         
         result = parser.parse_csv_file(csv_content, "test.csv")
@@ -240,3 +313,120 @@ class TestEdgeCases:
         assert result[0]['name'] == ' A '
         assert result[1]['name'] == ' B '
 
+    
+    def test_names_are_kept_as_written(self):
+        """Test that empty and NA-like names stay text instead of becoming missing."""
+        parser = get_parser()
+        csv_content = b"name,weight\n,0.25\nNA,0.25\nnull,0.25\nNaN,0.25"
+        
+        result = parser.parse_csv_file(csv_content, "test.csv")
+        
+        assert result.names == ('', 'NA', 'null', 'NaN')
+        assert result.weights.tolist() == [0.25] * 4
+    
+    def test_numeric_names_stay_strings(self):
+        """Test that numeric-looking symbols are kept as strings."""
+        parser = get_parser()
+        csv_content = b"name,weight\n123,0.5\n007,0.5"
+        
+        result = parser.parse_csv_file(csv_content, "test.csv")
+        
+        assert result[0]['name'] == '123'
+        assert result[1]['name'] == '007'
+    
+    def test_result_is_column_wise(self):
+        """
+        Test that the result keeps names and weights as columns, with a
+        read-only weight array, while still behaving like a list of dicts.
+        """
+        result = get_parser().parse_csv_file(b"name,weight\nA,0.25\nB,0.75", "test.csv")
+        
+        assert isinstance(result, Constituents)
+        assert result.names == ('A', 'B')
+        assert result.weights.dtype == np.float64
+        np.testing.assert_array_equal(result.weights, [0.25, 0.75])
+        assert not result.weights.flags.writeable, "Weights should be read-only"
+        
+        assert list(result) == [{'name': 'A', 'weight': 0.25}, {'name': 'B', 'weight': 0.75}]
+        assert result[-1] == {'name': 'B', 'weight': 0.75}
+        assert hash(result) == hash(Constituents(names=('A', 'B'), weights=[0.25, 0.75]))
+    
+    def test_equal_constituents_hash_alike(self):
+        """Test that constituents equal under -0.0 == 0.0 and NaN == NaN share a hash."""
+        quiet_nan = np.float64('nan')
+        other_nan = np.frombuffer(np.uint64(0x7ff8000000000001).tobytes(), dtype=np.float64)[0]
+        a = Constituents(names=('A', 'B'), weights=[0.0, quiet_nan])
+        b = Constituents(names=('A', 'B'), weights=[-0.0, other_nan])
+        
+        assert a.weights.tobytes() != b.weights.tobytes()
+        assert a == b
+        assert hash(a) == hash(b)
+    
+    def test_get_parser_returns_shared_instance(self):
+        """Test that get_parser reuses one parser per upload limit."""
+        assert get_parser() is get_parser()
+        assert get_parser(100) is get_parser(100)
+        assert get_parser(100) is not get_parser()
+        assert get_parser(100).max_upload_bytes == 100
+    
+    def test_parse_cache_skips_reparsing(self, monkeypatch):
+        """Test that identical content is served from the parse cache without copies."""
+        parser = ETFDataParser(cache_bytes=1 << 20)
+        csv_content = b"name,weight\nA,0.5\nB,0.5"
+        
+        first = parser.parse_csv_file(csv_content, "test.csv")
+        
+        def fail_parse(content):
+            raise AssertionError("cached content should not be parsed again")
+        monkeypatch.setattr(parser, '_parse_with_pyarrow', fail_parse)
+        monkeypatch.setattr(parser, '_parse_with_pandas', fail_parse)
+        
+        second = parser.parse_csv_file(csv_content, "copy.csv")
+        assert second is first
+        
+        # Modifying a returned row does not affect the cached constituents
+        second[0]['weight'] = 99
+        assert parser.parse_csv_file(csv_content, "test.csv") == [
+            {'name': 'A', 'weight': 0.5}, {'name': 'B', 'weight': 0.5}
+        ]
+    
+    def test_parse_cache_uses_given_digest(self, monkeypatch):
+        """Test that a digest passed by the caller is used as the cache key without rehashing."""
+        parser = ETFDataParser(cache_bytes=1 << 20)
+        csv_content = b"name,weight\nA,0.5\nB,0.5"
+        digest = etf_parser.hashlib.sha256(csv_content).digest()
+        
+        def fail_hash(*args, **kwargs):
+            raise AssertionError("content should not be hashed again")
+        monkeypatch.setattr(etf_parser.hashlib, 'sha256', fail_hash)
+        
+        first = parser.parse_csv_file(csv_content, "test.csv", digest)
+        assert parser.parse_csv_file(csv_content, "copy.csv", digest) is first
+    
+    def test_parse_cache_is_bounded_by_bytes(self):
+        """Test that the parse cache evicts by size and skips files larger than its budget."""
+        small = b"name,weight\nA,0.5\nB,0.5"
+        large = b"name,weight\n" + b"".join(b"SYM%d,0.0001\n" % i for i in range(10000))
+        
+        parser = ETFDataParser(cache_bytes=64 * 1024)
+        first = parser.parse_csv_file(small, "small.csv")
+        big = parser.parse_csv_file(large, "large.csv")
+        assert big.nbytes > 64 * 1024
+        
+        # The large file is not cached and did not evict the small one
+        assert parser.parse_csv_file(large, "large.csv") is not big
+        assert parser.parse_csv_file(small, "small.csv") is first
+        assert parser._cache.currsize <= parser._cache.maxsize
+    
+    def test_file_size_limit(self):
+        """Test that files over max_upload_bytes are rejected before parsing."""
+        csv_content = b"name,weight\nA,0.5\nB,0.5"
+        
+        parser = ETFDataParser(max_upload_bytes=len(csv_content) - 1)
+        with pytest.raises(ValueError) as exc_info:
+            parser.parse_csv_file(csv_content, "test.csv")
+        assert "file too large" in str(exc_info.value).lower()
+        
+        # A file exactly at the limit is accepted
+        parser = ETFDataParser(max_upload_bytes=len(csv_content))
+        assert len(parser.parse_csv_file(csv_content, "test.csv")) == 2
@@ -4,7 +4,12 @@ Unit Tests for ETFValidator Service
 Tests data validation logic including edge cases and error conditions.
 """
 
-from api.services import ETFValidator
+import numpy as np
+import pytest
+
+from api.services import Constituents, ETFValidator
+from api.services import _kernels
+from api.services import validator as validator_module
 
 
 class TestWeightSumValidation:
@@ -68,6 +73,29 @@ class TestWeightSumValidation:
         assert "1.01" in error_msg
 
 
+    def test_many_small_weights_sum_exactly(self):
+        """
+        Test that many weights summing to exactly 1.0 pass with zero tolerance.
+        
+        1000 × 0.001 drifts away from 1.0 with naive float addition.
+        """
+        validator = ETFValidator(tolerance=0.0)
+        constituents = [{'name': f'S{i}', 'weight': 0.001} for i in range(1000)]
+        
+        assert sum(c['weight'] for c in constituents) != 1.0
+        assert validator.validate_weights_sum(constituents) == (True, "")
+        assert validator.validate_all(constituents, [c['name'] for c in constituents]) == (True, [])
+    
+    def test_few_weights_sum_exactly(self):
+        """Test that short lists are summed exactly too (10 × 0.1 drifts as well)."""
+        validator = ETFValidator(tolerance=0.0)
+        constituents = [{'name': f'S{i}', 'weight': 0.1} for i in range(10)]
+        
+        assert sum(c['weight'] for c in constituents) != 1.0
+        assert validator.validate_weights_sum(constituents) == (True, "")
+        assert validator.validate_all(constituents, [c['name'] for c in constituents]) == (True, [])
+
+
 class TestWeightRangeValidation:
     """Test individual weight range validation."""
     
@@ -132,6 +160,73 @@ class TestWeightRangeValidation:
         assert 'C' in error_msg
         # Should NOT mention B (it's valid)
         assert 'B' not in error_msg or 'B:' not in error_msg
+    
+    
+    def test_missing_weight_fails_validation(self):
+        """Test that NaN weights (empty cells in the CSV) are reported."""
+        validator = ETFValidator()
+        constituents = [
+            {'name': 'A', 'weight': 0.5},
+            {'name': 'B', 'weight': float('nan')}  # ❌ Empty cell
+        ]
+        
+        is_valid, error_msg = validator.validate_weight_ranges(constituents)
+        
+        assert not is_valid
+        assert "B: nan (missing or not a number)" in error_msg
+        
+        # The single-pass validate_all reports the same message
+        _, errors = validator.validate_all(constituents, ['A', 'B'])
+        assert errors == [error_msg]
+    
+    
+    @pytest.mark.parametrize("force_numpy", [False, True])
+    def test_large_list_kernel_path(self, monkeypatch, force_numpy):
+        """
+        Test range validation above KERNEL_MIN_WEIGHTS, with and without numba.
+        """
+        if force_numpy:
+            monkeypatch.setattr(_kernels, 'HAS_NUMBA', False)
+        validator = ETFValidator()
+        constituents = [{'name': f'S{i}', 'weight': 0.001} for i in range(1000)]
+        assert len(constituents) > validator_module.KERNEL_MIN_WEIGHTS
+        
+        assert validator.validate_weight_ranges(constituents) == (True, "")
+        
+        constituents[700]['weight'] = float('nan')  # ❌
+        is_valid, error_msg = validator.validate_weight_ranges(constituents)
+        assert not is_valid
+        assert error_msg.splitlines()[1:] == ["  - S700: nan (missing or not a number)"]
+    
+    
+    @pytest.mark.parametrize("force_numpy", [False, True])
+    def test_check_ranges_finds_first_invalid(self, monkeypatch, force_numpy):
+        """Test that check_ranges returns the first NaN or out-of-range index, or -1."""
+        if force_numpy:
+            monkeypatch.setattr(_kernels, 'HAS_NUMBA', False)
+        weights = np.full(500, 0.002)
+        
+        assert _kernels.check_ranges(weights) == -1
+        
+        weights[[5, 300]] = [1.5, float('nan')]
+        assert _kernels.check_ranges(weights) == 5
+        assert _kernels.check_ranges(weights[6:]) == 294
+    
+    
+    def test_invalid_weights_in_large_list(self):
+        """Test that only the invalid entries of a large list are reported, in input order."""
+        validator = ETFValidator()
+        constituents = [{'name': f'S{i}', 'weight': 0.0005} for i in range(2000)]
+        constituents[1500]['weight'] = 2      # ❌ Too high
+        constituents[10]['weight'] = -0.25    # ❌ Negative
+        
+        is_valid, error_msg = validator.validate_weight_ranges(constituents)
+        
+        assert not is_valid
+        assert error_msg.splitlines()[1:] == [
+            "  - S10: -0.25 (negative weight)",
+            "  - S1500: 2 (exceeds 100%)"
+        ]
 
 
 class TestSymbolExistenceValidation:
@@ -191,6 +286,31 @@ class TestSymbolExistenceValidation:
         assert 'MISSING1' in error_msg
         assert 'MISSING2' in error_msg
         assert len(missing) == 2
+    
+    def test_symbol_set_gives_same_result_as_list(self):
+        """Test that a frozenset of symbols is accepted and matches the list result."""
+        validator = ETFValidator()
+        constituents = [
+            {'name': 'A', 'weight': 0.5},
+            {'name': 'MISSING', 'weight': 0.5}  # ❌
+        ]
+        available_symbols = ['C', 'B', 'A']
+        
+        from_list = validator.validate_symbols_exist(constituents, available_symbols)
+        from_set = validator.validate_symbols_exist(constituents, frozenset(available_symbols))
+        
+        assert from_set == from_list
+        assert from_set[2] == ['MISSING']
+    
+    def test_missing_symbols_message_previews_first_ten_available(self):
+        """Test that the error previews the 10 alphabetically first available symbols."""
+        validator = ETFValidator()
+        constituents = [{'name': 'MISSING', 'weight': 1.0}]  # ❌
+        available_symbols = [chr(c) for c in range(ord('Z'), ord('A') - 1, -1)]
+        
+        _, error_msg, _ = validator.validate_symbols_exist(constituents, available_symbols)
+        
+        assert error_msg.endswith("Available symbols: A, B, C, D, E, F, G, H, I, J...")
 
 
 class TestDuplicateValidation:
@@ -332,8 +452,9 @@ class TestValidateAll:
         assert len(errors) >= 2  # Should have at least 2 errors
         # Check that errors cover different issues
         error_text = '\n'.join(errors)
-        assert 'negative' in error_text.lower() or 'range' in error_text.lower()
-        assert 'UNKNOWN' in error_text or 'symbol' in error_text.lower()
+        error_text_lc = error_text.lower()
+        assert 'negative' in error_text_lc or 'range' in error_text_lc
+        assert 'UNKNOWN' in error_text or 'symbol' in error_text_lc
     
     
     def test_empty_constituents_stops_validation(self):
@@ -347,6 +468,132 @@ class TestValidateAll:
         assert not is_valid
         assert len(errors) == 1  # Only empty error, no further checks
         assert 'at least one' in errors[0].lower()
+    
+    
+    def test_errors_match_individual_validators(self):
+        """
+        Test that the single-pass validate_all reports the same messages,
+        in the same order, as running each validator separately.
+        """
+        validator = ETFValidator(tolerance=0.01)
+        constituents = [
+            {'name': 'A', 'weight': 0.5},
+            {'name': 'A', 'weight': 0.3},      # ❌ Duplicate
+            {'name': 'B', 'weight': -0.2},     # ❌ Negative
+            {'name': 'MISSING', 'weight': 1.5} # ❌ Too high, missing, sum off
+        ]
+        available_symbols = ['A', 'B', 'C']
+        
+        is_valid, errors = validator.validate_all(constituents, available_symbols)
+        
+        expected = [
+            validator.validate_no_duplicates(constituents)[1],
+            validator.validate_weight_ranges(constituents)[1],
+            validator.validate_weights_sum(constituents)[1],
+            validator.validate_symbols_exist(constituents, available_symbols)[1]
+        ]
+        assert not is_valid
+        assert errors == expected
+    
+    
+    def test_fail_fast_returns_first_error_only(self):
+        """Test that fail_fast stops at the first failing check."""
+        validator = ETFValidator()
+        constituents = [
+            {'name': 'A', 'weight': 0.5},
+            {'name': 'A', 'weight': 0.3},      # ❌ Duplicate
+            {'name': 'MISSING', 'weight': 1.5} # ❌ Too high, missing, sum off
+        ]
+        available_symbols = ['A', 'B']
+        
+        _, all_errors = validator.validate_all(constituents, available_symbols)
+        is_valid, errors = validator.validate_all(constituents, available_symbols, fail_fast=True)
+        
+        assert len(all_errors) == 4
+        assert not is_valid
+        assert errors == all_errors[:1]
+        
+        # Valid input is unaffected
+        valid_constituents = [{'name': 'A', 'weight': 0.4}, {'name': 'B', 'weight': 0.6}]
+        assert validator.validate_all(valid_constituents, available_symbols, fail_fast=True) == (True, [])
+    
+    
+    def test_fail_fast_skips_remaining_checks(self, monkeypatch):
+        """Test that fail_fast returns before the checks after the first failure run."""
+        def fail(*args, **kwargs):
+            raise AssertionError("checks after the first failure should not run")
+        monkeypatch.setattr(validator_module, '_find_missing', fail)
+        monkeypatch.setattr(validator_module.math, 'fsum', fail)
+        
+        validator = ETFValidator()
+        constituents = [
+            {'name': 'A', 'weight': -0.5},       # ❌ Negative
+            {'name': 'MISSING', 'weight': 0.2}   # ❌ Unknown symbol, sum off
+        ]
+        
+        is_valid, errors = validator.validate_all(constituents, ['A'], fail_fast=True)
+        
+        assert not is_valid
+        assert len(errors) == 1
+        assert 'negative weight' in errors[0]
+    
+    
+    def test_repeated_validation_is_cached(self):
+        """
+        Test that identical inputs are served from the memo and that the
+        returned error list can be modified without affecting later calls.
+        """
+        validator = ETFValidator()
+        constituents = [
+            {'name': 'A', 'weight': 0.5},
+            {'name': 'B', 'weight': 0.6}  # ❌ Sum is 1.1
+        ]
+        available_symbols = frozenset(['A', 'B'])
+        key = (b'digest', 1)
+        
+        is_valid, errors = validator.validate_all(constituents, available_symbols, cache_key=key)
+        errors.append("caller-side change")
+        
+        # The memo holds only the small key and the messages, not the inputs
+        def fail_checks(*args):
+            raise AssertionError("memoized result should not be recomputed")
+        validator._run_checks, run_checks = fail_checks, validator._run_checks
+        assert validator.validate_all(constituents, available_symbols, cache_key=key) == (False, errors[:1])
+        assert all(k[0] == key for k in validator._results)
+        
+        # Changing the tolerance is part of the key and re-runs the checks
+        validator._run_checks = run_checks
+        validator.tolerance = 0.2
+        assert validator.validate_all(constituents, available_symbols, cache_key=key) == (True, [])
+        
+        # Without a key nothing is memoized, and the memo can be cleared
+        validator.clear_cache()
+        validator.validate_all(constituents, available_symbols)
+        assert len(validator._results) == 0
+    
+    
+    def test_parsed_constituents_match_dicts(self):
+        """
+        Test that parsed Constituents (names tuple + weight array) get the
+        same result as the equivalent list of dicts.
+        """
+        constituents = [
+            {'name': 'A', 'weight': 0.5},
+            {'name': 'B', 'weight': -0.2},     # ❌ Negative
+            {'name': 'MISSING', 'weight': 0.4} # ❌ Unknown symbol, sum off
+        ]
+        parsed = Constituents(
+            names=tuple(c['name'] for c in constituents),
+            weights=[c['weight'] for c in constituents]
+        )
+        available_symbols = frozenset(['A', 'B'])
+        
+        from_dicts = ETFValidator().validate_all(constituents, available_symbols)
+        from_parsed = ETFValidator().validate_all(parsed, available_symbols)
+        
+        assert not from_parsed[0]
+        assert from_parsed == from_dicts
+        assert ETFValidator().validate_weight_ranges(parsed) == ETFValidator().validate_weight_ranges(constituents)
 
 
 class TestToleranceConfiguration:
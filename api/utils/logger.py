@@ -5,11 +5,29 @@ Provides consistent logging configuration across the application.
 """
 
 import logging
+import os
 import sys
+from functools import lru_cache
 from logging.handlers import RotatingFileHandler
 from pathlib import Path
 
+# One formatter shared by every handler (formatters hold no per-logger state)
+_FORMATTER = logging.Formatter(
+    '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
 
+
+def _in_test_mode() -> bool:
+    """
+    Check whether the code is running under the test suite.
+    
+    Returns:
+        True if ETF_TEST_MODE=1 or pytest is running a test
+    """
+    return os.environ.get('ETF_TEST_MODE') == '1' or 'PYTEST_CURRENT_TEST' in os.environ
+
+
+@lru_cache(maxsize=None)
 def setup_logger(name: str, log_file: str = None, level=logging.INFO):
     """
     Configure logger with consistent formatting and handling.
@@ -20,7 +38,8 @@ def setup_logger(name: str, log_file: str = None, level=logging.INFO):
         level: Logging level (default: INFO)
     
     Returns:
-        Configured logger instance
+        Configured logger instance (cached, so repeated calls with the
+        same arguments return it without reconfiguring)
     """
     logger = logging.getLogger(name)
     logger.setLevel(level)
@@ -29,13 +48,15 @@ def setup_logger(name: str, log_file: str = None, level=logging.INFO):
     if logger.handlers:
         return logger
     
-    formatter = logging.Formatter(
-        '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-    )
+    # Tests get no console or file output; records still propagate, so
+    # pytest's log capture keeps working
+    if _in_test_mode():
+        logger.addHandler(logging.NullHandler())
+        return logger
     
     # Console handler
     console_handler = logging.StreamHandler(sys.stdout)
-    console_handler.setFormatter(formatter)
+    console_handler.setFormatter(_FORMATTER)
     logger.addHandler(console_handler)
     
     # File handler (if log_file specified)
@@ -47,7 +68,7 @@ def setup_logger(name: str, log_file: str = None, level=logging.INFO):
             maxBytes=10485760,  # 10MB
             backupCount=5
         )
-        file_handler.setFormatter(formatter)
+        file_handler.setFormatter(_FORMATTER)
         logger.addHandler(file_handler)
     
     return logger